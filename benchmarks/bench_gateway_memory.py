@@ -0,0 +1,144 @@
+"""
+Resident set size of the bot's gateway caches with and without lean mode (BOT_LEAN_MODE).
+
+    python benchmarks/bench_gateway_memory.py [--members 100000] [--messages 5000]
+
+Each mode runs in a fresh interpreter that imports main, builds the bot exactly as configured,
+and feeds its connection state one synthetic large guild (GUILD_CREATE with every member, as
+chunking would fill it in) plus a burst of MESSAGE_CREATE events. Both modes get the same
+traffic; in lean mode Discord wouldn't even send most of it, so this understates the saving.
+"growth" is RSS after the traffic minus RSS right after import; it includes the synthetic
+payloads themselves, which are freed but partly kept by the allocator. No Discord connection is made.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUILD_ID = 559879519087886356
+CHANNEL_ID = GUILD_ID + 1
+JOINED_AT = "2024-01-01T00:00:00+00:00"
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux), falling back to the peak where /proc isn't available."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def user_payload(i: int) -> dict:
+    return {"id": str(GUILD_ID + 1000 + i), "username": f"viewer{i}", "discriminator": "0", "global_name": f"Viewer {i}", "avatar": None}
+
+def member_payload(i: int) -> dict:
+    return {"user": user_payload(i), "roles": [], "joined_at": JOINED_AT, "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(members: int) -> dict:
+    return {
+        "id": str(GUILD_ID),
+        "name": "Synthetic Large Guild",
+        "owner_id": str(GUILD_ID + 1000),
+        "member_count": members,
+        "large": True,
+        "members": [member_payload(i) for i in range(members)],
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []}],
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "voice_states": [],
+        "presences": [],
+    }
+
+def message_payload(i: int, members: int) -> dict:
+    author = i % members
+    return {
+        "id": str(GUILD_ID + 10_000_000 + i),
+        "channel_id": str(CHANNEL_ID),
+        "guild_id": str(GUILD_ID),
+        "author": user_payload(author),
+        "member": {"roles": [], "joined_at": JOINED_AT, "deaf": False, "mute": False, "flags": 0},
+        "content": f"message {i} from a viewer in chat",
+        "timestamp": JOINED_AT,
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+def child(members: int, messages: int):
+    """Runs in the subprocess: measures one mode and prints a JSON result line."""
+    sys.path.insert(0, ROOT)
+    import main
+
+    async def feed():
+        # What login() does first: bind the client to the running loop (events are dispatched as tasks)
+        await main.bot._async_setup_hook()
+        state = main.bot._connection
+        gc.collect()
+        before = rss_bytes()
+        guild_data = guild_payload(members)
+        state.parse_guild_create(guild_data)
+        del guild_data
+        for i in range(messages):
+            state.parse_message_create(message_payload(i, members))
+        gc.collect()
+        guild = main.bot.get_guild(GUILD_ID)
+        return before, rss_bytes(), len(guild.members), len(main.bot.cached_messages)
+
+    before, after, cached_members, cached_messages = asyncio.run(feed())
+    print(json.dumps({
+        "lean": main.LEAN_MODE,
+        "rss_before": before,  # right after import, before any gateway traffic
+        "rss_after": after,
+        "cached_members": cached_members,
+        "cached_messages": cached_messages,
+    }))
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.members, args.messages)
+        return
+
+    results = {}
+    for mode in ("0", "1"):
+        env = dict(os.environ, BOT_LEAN_MODE=mode)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--members", str(args.members), "--messages", str(args.messages)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"synthetic guild: {args.members:,} members, {args.messages:,} messages")
+    print(f"{'':<22}{'cached members':>16}{'cached msgs':>13}{'RSS after (MB)':>16}{'growth (MB)':>13}")
+    for mode, label in (("0", "full intents"), ("1", "lean mode")):
+        r = results[mode]
+        print(f"{label:<22}{r['cached_members']:>16,}{r['cached_messages']:>13,}"
+              f"{r['rss_after'] / 1e6:>16.1f}{(r['rss_after'] - r['rss_before']) / 1e6:>13.1f}")
+    full, lean = results["0"]["rss_after"], results["1"]["rss_after"]
+    print(f"lean mode RSS: {lean / full:.0%} of full ({(full - lean) / 1e6:.1f} MB less)")
+
+if __name__ == "__main__":
+    main_bench()
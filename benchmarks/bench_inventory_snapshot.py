@@ -0,0 +1,116 @@
+"""
+Memory and lookup latency of the in-memory inventory snapshot (InventoryRow/GuildInventory)
+versus keeping the equivalent get_user_rewards dictionaries in a plain dict.
+
+    python benchmarks/bench_inventory_snapshot.py [--users 100000]
+
+No database or Discord connection is needed: rows are synthetic.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("INVENTORY_SNAPSHOT", "1")
+
+import main
+
+GUILD_ID = 1
+REWARD_KEYS = [key for key, _, _ in main.DEFAULT_REWARD_CATALOG]
+
+def synthetic_rows(users: int, seed: int = 1) -> list:
+    """'user_rewards' statement rows: (discord_id, log_recent_1..3, {reward_key: count})."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(users):
+        discord_id = 100_000_000_000_000_000 + i
+        # Most viewers hold a handful of reward types
+        held = rng.sample(REWARD_KEYS, rng.randint(0, 4))
+        rewards = {key: rng.randint(1, 5) for key in held}
+        logs = tuple(
+            f"**[10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} EDT]** "
+            f"{rng.choice(['🟢', '🔴'])} '{rng.choice(main.DEFAULT_REWARD_CATALOG)[1]}' added to inventory."
+            if rng.random() < 0.8 else None
+            for _ in main.LOG_COLUMNS
+        )
+        rows.append((discord_id, *logs, rewards))
+    return rows
+
+def measure(build) -> tuple:
+    """Returns (result, bytes still allocated by build())."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.users)
+    ids = [row[0] for row in rows]
+    # The DB hands back fresh objects every time; copy so neither structure shares them with `rows`
+    def fresh(row):
+        return (row[0], *(log[:-1] + log[-1] if log else None for log in row[1:-1]), dict(row[-1]))
+
+    # Dict path: what a plain cache of get_user_rewards results would hold
+    dict_cache, dict_bytes = measure(
+        lambda: {(GUILD_ID, row[0]): main.user_rewards_from_row(fresh(row)) for row in rows}
+    )
+
+    # Snapshot path: the compact rows load_inventory_snapshot builds
+    def build_snapshot():
+        guild = main.GuildInventory()
+        for row in rows:
+            rewards = row[-1]
+            guild.rows[row[0]] = guild.make_row(rewards.keys(), rewards.values(), fresh(row)[1:-1])
+        return guild
+    guild, snapshot_bytes = measure(build_snapshot)
+
+    main._inventory = {GUILD_ID: guild}
+    main._change_listener_healthy = True
+    assert main.lookup_inventory_snapshot(GUILD_ID, ids[0]) == (True, dict_cache[(GUILD_ID, ids[0])])
+
+    rng = random.Random(2)
+    sample = [rng.choice(ids) for _ in range(args.lookups)]
+
+    def dict_lookups():
+        for discord_id in sample:
+            dict_cache.get((GUILD_ID, discord_id))
+
+    def snapshot_lookups():
+        for discord_id in sample:
+            main.lookup_inventory_snapshot(GUILD_ID, discord_id)
+
+    # Without the snapshot every read builds its dict from the DB row (query time not included)
+    by_id = {row[0]: row for row in rows}
+    sample_rows = [by_id[discord_id] for discord_id in sample]
+
+    def row_to_dict():
+        for row in sample_rows:
+            main.user_rewards_from_row(row)
+
+    dict_ns = min(timeit.repeat(dict_lookups, number=1, repeat=5)) / len(sample) * 1e9
+    snapshot_ns = min(timeit.repeat(snapshot_lookups, number=1, repeat=5)) / len(sample) * 1e9
+    row_ns = min(timeit.repeat(row_to_dict, number=1, repeat=5)) / len(sample) * 1e9
+
+    scale = 100_000 / args.users
+    print(f"users: {args.users:,}   lookups: {len(sample):,}")
+    print(f"{'':<28}{'MB per 100k users':>20}{'ns per lookup':>16}")
+    print(f"{'dict of user_rewards dicts':<28}{dict_bytes * scale / 1e6:>20.1f}{dict_ns:>16.0f}")
+    print(f"{'InventoryRow snapshot':<28}{snapshot_bytes * scale / 1e6:>20.1f}{snapshot_ns:>16.0f}")
+    print(f"{'DB row -> dict (no snapshot)':<28}{'-':>20}{row_ns:>16.0f}")
+    print(f"snapshot memory vs dict: {snapshot_bytes / dict_bytes:.0%}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,178 @@
+"""
+Startup time of each entry point (python main.py bot|web|migrate), from a cold interpreter.
+
+    python benchmarks/bench_startup.py [--runs 5] [--dsn postgresql://...]
+
+Each run of each mode starts a fresh interpreter, imports main and does what that mode does
+first. Times are milliseconds since the interpreter was spawned (median over the runs);
+"interpreter" is when the child's own code starts and "import" when `import main` returns.
+
+  bot      the real start_bot() with a stubbed gateway: login and connect are replaced by a
+           fake READY followed straight away by a /my-rewards interaction, and command sync and
+           interaction replies go nowhere. Milestones are main's own startup marks (gateway
+           ready, db ready, commands synced, first command) as reported in /metrics.
+  web      create_app(bot_in_process=False) and its first request to /.
+  migrate  setup_db().
+
+Without --dsn (or DATABASE_URL) the database steps fail fast, so "db ready", "first command" and
+"setup_db" then time the no-database path. With a DSN, migrate runs the real (idempotent) schema
+setup and the bot's /my-rewards reads a real row. No Discord connection is made.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUILD_ID = 559879519087886356
+BOT_USER_ID = GUILD_ID + 2
+VIEWER_ID = GUILD_ID + 1000
+COMMAND_TIMEOUT = 30
+
+MILESTONES = {
+    "bot": ["gateway_ready", "db_ready", "commands_synced", "first_command"],
+    "web": ["first_request"],
+    "migrate": ["setup_db"],
+}
+
+def interaction_payload(command: str) -> dict:
+    """A slash command invocation as the gateway delivers it (INTERACTION_CREATE)."""
+    return {
+        "id": str(GUILD_ID + 10_000),
+        "application_id": str(BOT_USER_ID),
+        "type": 2,
+        "token": "bench",
+        "version": 1,
+        "guild_id": str(GUILD_ID),
+        "channel_id": str(GUILD_ID + 1),
+        "member": {
+            "user": {"id": str(VIEWER_ID), "username": "viewer", "discriminator": "0", "avatar": None},
+            "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+            "flags": 0, "permissions": "0",
+        },
+        "data": {"id": str(GUILD_ID + 20_000), "name": command, "type": 1},
+        "locale": "en-US",
+        "guild_locale": "en-US",
+        "app_permissions": "0",
+        "attachment_size_limit": 10 * 1024 * 1024,
+        "entitlements": [],
+        "authorizing_integration_owners": {},
+    }
+
+def stub_gateway(main):
+    """Replaces everything that would talk to Discord; the rest of the startup path runs as-is."""
+    import discord
+    from discord.webhook.async_ import AsyncWebhookAdapter
+
+    bot = main.bot
+
+    async def login(token):
+        # What the real login() does first: bind the client to the running loop
+        await bot._async_setup_hook()
+
+    async def connect(*, reconnect=True):
+        state = bot._connection
+        state.user = discord.ClientUser(state=state, data={"id": str(BOT_USER_ID), "username": "StaticRewardsBot", "discriminator": "0", "avatar": None})
+        state.application_id = BOT_USER_ID
+        bot.dispatch("ready")
+        # A viewer who was waiting for the bot: the command arrives as soon as the gateway is up
+        state.parse_interaction_create(interaction_payload("my-rewards"))
+        deadline = time.monotonic() + COMMAND_TIMEOUT
+        while "first_command" not in main._startup_marks and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+
+    async def sync(*, guild=None):
+        return []
+
+    async def create_interaction_response(self, interaction_id, token, **kwargs):
+        return {"interaction": {"id": str(interaction_id), "type": 2}}
+
+    async def execute_webhook(self, *args, **kwargs):
+        # The followup message as Discord echoes it back
+        return {
+            "id": str(GUILD_ID + 30_000), "channel_id": str(GUILD_ID + 1), "type": 0, "content": "",
+            "author": {"id": str(BOT_USER_ID), "username": "StaticRewardsBot", "discriminator": "0", "avatar": None},
+            "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+            "embeds": [], "pinned": False, "flags": 64,
+        }
+
+    bot.login = login
+    bot.connect = connect
+    bot.tree.sync = sync
+    AsyncWebhookAdapter.create_interaction_response = create_interaction_response
+    AsyncWebhookAdapter.execute_webhook = execute_webhook
+
+def child(mode: str, spawned: float):
+    """Runs in the subprocess: starts one mode and prints a JSON line of milestone times."""
+    marks = {"interpreter": time.time() - spawned}
+    sys.path.insert(0, ROOT)
+    import main
+    # main's marks are relative to its own PROCESS_START; shift them to the spawn time
+    offset = (time.time() - spawned) - (time.perf_counter() - main.PROCESS_START)
+    marks["import"] = offset + main._startup_marks["import"]
+
+    if mode == "bot":
+        stub_gateway(main)
+        main.start_bot()
+        marks.update({name: offset + seconds for name, seconds in main._startup_marks.items() if name != "import"})
+    elif mode == "web":
+        response = main.create_app(bot_in_process=False).test_client().get("/")
+        assert response.status_code == 200
+        marks["first_request"] = time.time() - spawned
+    else:
+        ok = main.setup_db()
+        marks["setup_db"] = time.time() - spawned
+        marks["setup_db_ok"] = ok
+
+    print(json.dumps(marks))
+
+def run_mode(mode: str, env: dict, workdir: str) -> dict:
+    spawned = time.time()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--spawned", repr(spawned)],
+        env=env, cwd=workdir, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres DSN for the database steps")
+    parser.add_argument("--child", choices=list(MILESTONES), help=argparse.SUPPRESS)
+    parser.add_argument("--spawned", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.spawned)
+        return
+
+    # No HTTP server, and the bot's outbox file goes to a scratch directory
+    env = {key: value for key, value in os.environ.items() if key not in ("PORT", "DATABASE_URL")}
+    env["DISCORD_TOKEN"] = "bench"
+    if args.dsn:
+        env["DATABASE_URL"] = args.dsn
+
+    print(f"{args.runs} cold start(s) per mode, database: {'yes' if args.dsn else 'none'}; "
+          f"ms since the interpreter was spawned (median)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode, milestones in MILESTONES.items():
+            runs = [run_mode(mode, env, workdir) for _ in range(args.runs)]
+            print(f"\n{mode}")
+            for name in ["interpreter", "import", *milestones]:
+                times = [run[name] for run in runs if name in run]
+                if not times:
+                    print(f"  {name.replace('_', ' '):<18}{'not reached':>12}")
+                    continue
+                print(f"  {name.replace('_', ' '):<18}{statistics.median(times) * 1000:>12.0f}")
+            if mode == "migrate" and not all(run["setup_db_ok"] for run in runs):
+                print("  (setup_db failed: no database reachable)")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,163 @@
+"""
+Per-call cost of the reward hot paths before and after the prepared statement registry.
+
+    python benchmarks/bench_statement_registry.py [--calls 200000] [--dsn postgresql://...]
+
+The Python side (building SQL text, picking the display name, turning a row into a dict) runs
+against a no-op cursor, so it needs no database. With --dsn (or DATABASE_URL) it also times the
+server side: the same UPDATE sent as plain SQL versus EXECUTE of a prepared statement, on a
+TEMP table inside a transaction that is rolled back.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discord import app_commands
+
+import main
+
+GUILD_ID = 1
+DISCORD_ID = 100_000_000_000_000_000
+# The reward the old linear scans had to walk furthest for
+REWARD_KEY, REWARD_NAME, _ = main.DEFAULT_REWARD_CATALOG[-1]
+
+# How the rewards were declared before the registry (one users column per reward)
+REWARD_CHOICES = [app_commands.Choice(name=name, value=key) for key, name, _ in main.DEFAULT_REWARD_CATALOG]
+VALID_REWARD_COLUMNS = [choice.value for choice in REWARD_CHOICES]
+
+class NoOpConnection:
+    def __init__(self):
+        self.prepared = set()
+
+class NoOpCursor:
+    """Accepts SQL without sending it anywhere, so only the Python-side work is timed."""
+
+    def __init__(self):
+        self.connection = NoOpConnection()
+
+    def execute(self, sql, params=None):
+        pass
+
+# --- Before: what every call did without the registry ---
+
+def old_increment(cursor):
+    column = REWARD_KEY
+    if column not in VALID_REWARD_COLUMNS:
+        raise ValueError(column)
+    reward_name = next(choice.name for choice in REWARD_CHOICES if choice.value == column)
+    cursor.execute(f"""
+    UPDATE users
+    SET {column} = {column} + 1
+    WHERE guild_id = %s AND discord_id = %s
+    RETURNING {column};
+    """, (GUILD_ID, DISCORD_ID))
+    return reward_name
+
+def old_user_rewards(cursor, row):
+    reward_columns = VALID_REWARD_COLUMNS
+    log_columns = ["log_recent_1", "log_recent_2", "log_recent_3"]
+    all_columns = reward_columns + log_columns
+    cursor.execute(f"""
+    SELECT discord_id, {', '.join(all_columns)}
+    FROM users
+    WHERE guild_id = %s AND discord_id = %s;
+    """, (GUILD_ID, DISCORD_ID))
+    return dict(zip(["discord_id"] + all_columns, row))
+
+# --- After: registry statements and catalog metadata ---
+
+def new_increment(cursor):
+    reward = main.find_catalog_reward(GUILD_ID, REWARD_KEY)
+    main.execute_prepared(cursor, "increment_reward", (GUILD_ID, DISCORD_ID, REWARD_KEY))
+    return reward.name
+
+def new_user_rewards(cursor, row):
+    main.execute_prepared(cursor, "user_rewards", (GUILD_ID, DISCORD_ID))
+    return main.user_rewards_from_row(row)
+
+def per_call_ns(func, calls: int) -> float:
+    return min(timeit.repeat(func, number=calls, repeat=5)) / calls * 1e9
+
+def bench_python(calls: int):
+    # Serve the catalog from the process cache, as it is between reloads
+    main._catalog_cache[GUILD_ID] = (float("inf"), main.default_reward_catalog())
+    main._change_listener_healthy = True
+
+    log = "**[10-19 20:15 EDT]** 🟢 'Tier List' added to inventory."
+    old_row = (DISCORD_ID, *([0] * (len(VALID_REWARD_COLUMNS) - 1)), 2, log, log, None)
+    new_row = (DISCORD_ID, log, log, None, {REWARD_KEY: 2})
+    cursor = NoOpCursor()
+    assert old_increment(cursor) == new_increment(cursor) == REWARD_NAME
+
+    print(f"Python work per call ({calls:,} calls, best of 5):")
+    print(f"{'':<34}{'before (ns)':>14}{'after (ns)':>14}")
+    for label, old, new in (
+        ("increment: SQL + display name", lambda: old_increment(cursor), lambda: new_increment(cursor)),
+        ("get_user_rewards: SQL + dict", lambda: old_user_rewards(cursor, old_row), lambda: new_user_rewards(cursor, new_row)),
+    ):
+        print(f"{label:<34}{per_call_ns(old, calls):>14.0f}{per_call_ns(new, calls):>14.0f}")
+    # Shared by both paths (the timestamp for the activity log), for scale
+    print(f"{'format_log_entry (unchanged)':<34}{per_call_ns(lambda: main.format_log_entry('x'), calls // 10):>14.0f}")
+
+def bench_server(dsn: str, calls: int):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TEMP TABLE bench_reward_counts (
+                guild_id BIGINT, discord_id BIGINT, reward_key VARCHAR(64), count INTEGER,
+                PRIMARY KEY (guild_id, discord_id, reward_key)
+            );
+        """)
+        cursor.execute("""
+            INSERT INTO bench_reward_counts
+            SELECT %s, id, %s, 0 FROM generate_series(1, 10000) AS id;
+        """, (GUILD_ID, REWARD_KEY))
+        update_sql = """
+            UPDATE bench_reward_counts SET count = count + 1
+            WHERE guild_id = {0} AND discord_id = {1} AND reward_key = {2}
+            RETURNING count"""
+        cursor.execute(f"PREPARE bench_increment AS {update_sql.format('$1', '$2', '$3')};")
+        plain_sql = update_sql.format('%s', '%s', '%s') + ";"
+
+        def plain():
+            for i in range(calls):
+                cursor.execute(plain_sql, (GUILD_ID, i % 10000 + 1, REWARD_KEY))
+                cursor.fetchone()
+
+        def prepared():
+            for i in range(calls):
+                cursor.execute("EXECUTE bench_increment(%s, %s, %s);", (GUILD_ID, i % 10000 + 1, REWARD_KEY))
+                cursor.fetchone()
+
+        print(f"\nServer round trip per call ({calls:,} UPDATEs, best of 3):")
+        for label, run in (("plain SQL", plain), ("PREPARE/EXECUTE", prepared)):
+            best = min(timeit.repeat(run, number=1, repeat=3))
+            print(f"{label:<34}{best / calls * 1e6:>14.1f} us")
+    finally:
+        conn.rollback()
+        conn.close()
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--server-calls", type=int, default=5_000)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    args = parser.parse_args()
+
+    bench_python(args.calls)
+    if args.dsn:
+        bench_server(args.dsn, args.server_calls)
+    else:
+        print("\n(set --dsn or DATABASE_URL to also time the server side)")
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    main_bench()
+    print(f"\ndone in {time.perf_counter() - started:.1f}s")
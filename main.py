@@ -1,75 +1,441 @@
+import time
+
+# Startup benchmark: everything is measured from here (see record_startup_mark)
+PROCESS_START = time.perf_counter()
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import os
+import sys
+import io
+import hmac
 import asyncio
-from flask import Flask
 import threading
-import psycopg2 
+import contextlib
+import heapq
+import itertools
+import random
+import json
+import re
+import uuid
+import traceback
+from array import array
+from collections import Counter, namedtuple
 from datetime import datetime
-import pytz
 
 from discord import app_commands
 
-REWARD_CHOICES = [
-    discord.app_commands.Choice(name="Free Points Reward", value="free_points_reward_count"),
-    discord.app_commands.Choice(name="Tier List", value="tier_list_count"),
-    discord.app_commands.Choice(name="Watch Video", value="watch_video_count"),
-    discord.app_commands.Choice(name="Replay Analysis", value="replay_analysis_count"),
-    discord.app_commands.Choice(name="Listen to Album", value="album_count"),
-    discord.app_commands.Choice(name="DJ Rest of Stream", value="dj_count"),
-    discord.app_commands.Choice(name="Song Request Rest of Stream", value="song_request_count"),
-    discord.app_commands.Choice(name="Shuffle Artist of your Choice", value="shuffle_count"),
-    discord.app_commands.Choice(name="Play Marbles on Stream", value="marbles_count"),
-    discord.app_commands.Choice(name="Play 5 Games of 1v1", value="ones_count"),
-    discord.app_commands.Choice(name="Play Jackbox", value="jackbox_count"),
-    discord.app_commands.Choice(name="Play 5 games of KBM", value="kbm_count"),
-    discord.app_commands.Choice(name="Cast your RL Game", value="cast_count"),
-    # Add more rewards here following the 'name': 'database_column_name' structure
+# NOTE: Flask, psycopg2 and pytz are imported lazily where they're used, so each CLI mode
+# (bot / web / migrate) only pays for the components it actually runs.
+
+# The reward catalog a guild starts with: (reward_key, user-friendly name, expiry hours or None).
+# Each guild's catalog lives in the 'reward_catalog' table and is edited at runtime with the
+# /catalog-* commands; this list only seeds it (the keys are the original users-table column names).
+DEFAULT_REWARD_CATALOG = [
+    ("free_points_reward_count", "Free Points Reward", None),
+    ("tier_list_count", "Tier List", None),
+    ("watch_video_count", "Watch Video", None),
+    ("replay_analysis_count", "Replay Analysis", None),
+    ("album_count", "Listen to Album", None),
+    # DJ and song requests lapse if they aren't used within a day
+    ("dj_count", "DJ Rest of Stream", 24),
+    ("song_request_count", "Song Request Rest of Stream", 24),
+    ("shuffle_count", "Shuffle Artist of your Choice", None),
+    ("marbles_count", "Play Marbles on Stream", None),
+    ("ones_count", "Play 5 Games of 1v1", None),
+    ("jackbox_count", "Play Jackbox", None),
+    ("kbm_count", "Play 5 games of KBM", None),
+    ("cast_count", "Cast your RL Game", None),
 ]
 
-VALID_REWARD_COLUMNS = [choice.value for choice in REWARD_CHOICES]
+# How often (in seconds) the expiry sweeper runs, and how many grants it expires per transaction.
+EXPIRY_SWEEP_INTERVAL = int(os.getenv('EXPIRY_SWEEP_INTERVAL', '60'))
+EXPIRY_BATCH_SIZE = int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+# Viewers get a DM this many hours before a grant expires (0 = no warnings)
+EXPIRY_WARNING_HOURS = int(os.getenv('EXPIRY_WARNING_HOURS', '2'))
 
 # Load environment variables. IMPORTANT: These MUST be set in Render's dashboard.
 token = os.getenv('DISCORD_TOKEN')
 DATABASE_URL = os.getenv('DATABASE_URL')
-# Replace with your actual Guild ID
+# Optional read replica for viewer-facing lookups (leave unset to read from DATABASE_URL)
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL')
+# The original single-server guild. Rows created before multi-guild support are
+# migrated into this guild, and ADMIN_USER_ID is seeded as its first admin.
 GUILD_ID = 559879519087886356
-# For adding and removing rewards
+# Bot owner: always an admin in every guild (and the only one who can run owner-level commands)
 ADMIN_USER_ID = 341072622735327232
 
+# Sharding: leave unset to let Discord pick the shard count and run every shard in this
+# process. To split shards across processes set SHARD_COUNT and SHARD_IDS (e.g. "0-3" or "0,2").
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+
+def parse_shard_ids(raw: str | None):
+    """Parses a shard range like '0-3' or a list like '0,2,5' into a list of ints."""
+    if not raw:
+        return None
+    shard_ids = []
+    for part in raw.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids or None
+
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+
+# Lean mode: every feature is a slash command and the discord.Member arrives in the
+# interaction payload, so we don't need the member list or message events at all.
+# Opt in with BOT_LEAN_MODE=1; it changes the gateway intents and member cache, so existing
+# deployments keep the full intents until they choose to switch.
+LEAN_MODE = os.getenv('BOT_LEAN_MODE', '0') == '1'
+# Messages kept in memory in lean mode (0 disables the message cache entirely)
+LEAN_MAX_MESSAGES = int(os.getenv('BOT_LEAN_MAX_MESSAGES', '0'))
+
 # Intents
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+if LEAN_MODE:
+    # Only the guilds intent: needed for guild/channel cache used by interactions
+    intents = discord.Intents.none()
+    intents.guilds = True
+
+    bot = commands.AutoShardedBot(
+        command_prefix=None,
+        intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        chunk_guilds_at_startup=False,
+        max_messages=LEAN_MAX_MESSAGES or None,
+        shard_count=SHARD_COUNT,
+        shard_ids=SHARD_IDS,
+    )
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
 
-bot = commands.Bot(command_prefix=None, intents = intents)
+    bot = commands.AutoShardedBot(command_prefix=None, intents = intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 
 # --- PostgreSQL Helper Functions ---
 
-def get_db_connection():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    if not DATABASE_URL:
+# Connection pool size. Every helper borrows a connection for one short transaction.
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+# Seconds to wait for a free pooled connection before treating the DB as unavailable
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+# Seconds to wait for a new connection to open (so an unreachable host fails fast)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+
+# Returned by reward mutations when the DB can't be reached, so callers can queue them in the outbox
+DB_UNAVAILABLE_MESSAGE = "Database connection failed."
+
+_prepared_connection_class = None
+
+def get_prepared_connection_class():
+    """Builds (once) the psycopg2 connection class that remembers which registry statements it has PREPAREd."""
+    global _prepared_connection_class
+    if _prepared_connection_class is None:
+        import psycopg2.extensions
+
+        class PreparedConnection(psycopg2.extensions.connection):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.prepared = set()
+
+        _prepared_connection_class = PreparedConnection
+    return _prepared_connection_class
+
+# Pools by role: 'primary' (DATABASE_URL) and, if configured, 'replica' (READ_DATABASE_URL)
+DB_URLS = {"primary": DATABASE_URL, "replica": READ_DATABASE_URL}
+_db_pools = {}
+_db_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of waiting when it's exhausted, so we gate it ourselves
+_db_pool_slots = {role: threading.BoundedSemaphore(DB_POOL_MAX) for role in DB_URLS}
+
+def get_db_connection(role: str = "primary"):
+    """Borrows a connection to the PostgreSQL database from the pool. Return it with release_db_connection()."""
+    dsn = DB_URLS[role]
+    if not dsn:
         print("FATAL ERROR: DATABASE_URL environment variable is not set. Cannot connect to DB.")
         return None
+    slots = _db_pool_slots[role]
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        print(f"FATAL ERROR: Timed out waiting for a free {role} database connection.")
+        return None
     try:
-        # psycopg2 can use the full URL format directly
-        conn = psycopg2.connect(DATABASE_URL)
+        with _db_pool_lock:
+            if role not in _db_pools:
+                import psycopg2.pool
+                # psycopg2 can use the full URL format directly
+                _db_pools[role] = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, dsn,
+                    connection_factory=get_prepared_connection_class(), connect_timeout=DB_CONNECT_TIMEOUT
+                )
+        conn = _db_pools[role].getconn()
+        conn.pool_role = role
         return conn
     except Exception as e:
-        print(f"FATAL ERROR: Failed to connect to database: {e}")
+        slots.release()
+        print(f"FATAL ERROR: Failed to connect to {role} database: {e}")
         return None
 
-def log_reward_activity(discord_id: int, log_message: str):
+def release_db_connection(conn):
+    """Returns a borrowed connection to its pool, discarding it if it broke."""
+    import psycopg2.extensions
+    pool = _db_pools[conn.pool_role]
+    try:
+        if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Early returns after a SELECT leave a transaction open; don't hand that to the next caller
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
+    except Exception as e:
+        print(f"Discarding database connection: {e}")
+        try:
+            pool.putconn(conn, close=True)
+        except Exception:
+            pass
+    finally:
+        _db_pool_slots[conn.pool_role].release()
+
+def is_db_unavailable_error(error: Exception) -> bool:
+    """True for errors that mean the DB (not the query) failed: dropped connections, timeouts, restarts."""
+    import psycopg2
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+# --- Read Replica Routing ---
+# Viewer reads go to READ_DATABASE_URL unless (a) the user being read was written to within
+# READ_YOUR_WRITES_WINDOW seconds (so nobody sees their own change "undone"), (b) the replica
+# is lagging more than REPLICA_MAX_LAG seconds, or (c) the replica recently failed.
+
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '10'))
+# How often the replica's lag is re-measured, and how long it's avoided after a failure
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '5'))
+REPLICA_RETRY_AFTER = float(os.getenv('REPLICA_RETRY_AFTER', '30'))
+
+_recent_writes = {}          # (guild_id, discord_id) -> monotonic time until reads must use the primary
+_replica_avoid_until = 0.0   # monotonic time until the replica is skipped (failure or lag)
+_replica_checked_at = 0.0
+_replica_check_lock = threading.Lock()
+
+def note_user_write(guild_id: int, discord_id: int):
+    """Pins reads of a user to the primary for a short while after they were changed."""
+    now = time.monotonic()
+    if len(_recent_writes) > 4096:
+        for key in [k for k, until in _recent_writes.items() if until < now]:
+            _recent_writes.pop(key, None)
+    _recent_writes[(guild_id, discord_id)] = now + READ_YOUR_WRITES_WINDOW
+
+def mark_replica_unavailable(reason: str):
+    """Sends all reads to the primary for REPLICA_RETRY_AFTER seconds."""
+    global _replica_avoid_until
+    _replica_avoid_until = time.monotonic() + REPLICA_RETRY_AFTER
+    print(f"Read replica unavailable, using primary for {REPLICA_RETRY_AFTER:.0f}s: {reason}")
+
+def measure_replica_lag() -> float:
     """
-    Performs the log rotation (shifts log 1 to 2, 2 to 3, and writes new log to 1).
+    Returns how far (in seconds) the replica is behind the primary: 0 once it has replayed
+    everything the primary had written when we asked, otherwise the age of its last replayed
+    transaction. Comparing with the primary's WAL position (not the replica's own received WAL)
+    also catches a broken WAL stream, where receive and replay stop at the same point.
     """
     conn = get_db_connection()
     if not conn:
-        print(f"Failed to log activity for {discord_id}: DB connection failed.")
-        return
+        raise RuntimeError("could not reach the primary to compare WAL positions")
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_current_wal_lsn()::text;")
+        primary_lsn = cursor.fetchone()[0]
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    conn = get_db_connection("replica")
+    if not conn:
+        raise RuntimeError("could not connect")
+
+    cursor = conn.cursor()
+    try:
+        # NULL replay position means it isn't a standby at all (e.g. pointed at the primary): no lag.
+        # Behind with nothing replayed since it started means we can't tell how far: treat as too far.
+        cursor.execute("""
+            SELECT CASE
+                WHEN pg_last_wal_replay_lsn() IS NULL OR pg_last_wal_replay_lsn() >= %s::pg_lsn THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity'::float8)
+            END;
+        """, (primary_lsn,))
+        return float(cursor.fetchone()[0])
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def use_replica_for(guild_id: int, discord_id: int) -> bool:
+    """True if a read of this user's data may be served by the replica right now."""
+    global _replica_checked_at, _replica_avoid_until
+    if not READ_DATABASE_URL:
+        return False
+
+    now = time.monotonic()
+    if _recent_writes.get((guild_id, discord_id), 0) > now or _replica_avoid_until > now:
+        return False
+
+    # Re-measure the lag periodically; one caller does it while the others use the last result
+    if now - _replica_checked_at > REPLICA_LAG_CHECK_INTERVAL and _replica_check_lock.acquire(blocking=False):
+        try:
+            _replica_checked_at = now
+            lag = measure_replica_lag()
+            if lag > REPLICA_MAX_LAG:
+                # Checked again at the next interval, so routing returns as soon as it catches up
+                _replica_avoid_until = now + REPLICA_LAG_CHECK_INTERVAL
+                print(f"Read replica is {lag:.1f}s behind (max {REPLICA_MAX_LAG:.0f}s), using primary.")
+                return False
+        except Exception as e:
+            mark_replica_unavailable(str(e))
+            return False
+        finally:
+            _replica_check_lock.release()
+
+    return True
+
+def fetch_one_for_read(guild_id: int, discord_id: int, statement: str, params: tuple):
+    """
+    Runs a single-row prepared read about one user, on the replica when it's safe to and on
+    the primary otherwise (or if the replica fails). Returns (ok, row); ok is False only if
+    the primary failed too.
+    """
+    if use_replica_for(guild_id, discord_id):
+        conn = get_db_connection("replica")
+        if conn:
+            cursor = conn.cursor()
+            try:
+                execute_prepared(cursor, statement, params)
+                return True, cursor.fetchone()
+            except Exception as e:
+                mark_replica_unavailable(str(e))
+            finally:
+                cursor.close()
+                release_db_connection(conn)
+        else:
+            mark_replica_unavailable("could not connect")
+
+    conn = get_db_connection()
+    if not conn:
+        return False, None
 
     cursor = conn.cursor()
+    try:
+        execute_prepared(cursor, statement, params)
+        return True, cursor.fetchone()
+
+    except Exception as e:
+        print(f"Error running read query '{statement}' for {discord_id}: {e}")
+        return False, None
 
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+# --- Prepared Statement Registry ---
+# Every hot-path query is built once here and PREPAREd server-side the first time each pooled
+# connection uses it, so calls only send EXECUTE name(args): no SQL string building in Python
+# and no parse/plan work in Postgres. The reward is a plain parameter ($n = reward_key), so
+# one statement per query shape covers every reward in every guild's catalog.
+
+LOG_COLUMNS = ["log_recent_1", "log_recent_2", "log_recent_3"]
+# Field names of the users columns returned by get_user_rewards, in SELECT order
+USER_REWARD_FIELDS = ["discord_id"] + LOG_COLUMNS
+
+def build_statement_registry() -> dict:
+    """Returns {statement_name: (prepare_sql, execute_sql)} for every prepared statement."""
+    statements = {
+        # The user's row plus all of their reward counts as one {reward_key: count} JSON object
+        "user_rewards": f"""
+            SELECT {', '.join('u.' + field for field in USER_REWARD_FIELDS)},
+                COALESCE(
+                    json_object_agg(c.reward_key, c.count) FILTER (WHERE c.reward_key IS NOT NULL),
+                    '{{}}'::json
+                )
+            FROM users u
+            LEFT JOIN user_reward_counts c ON c.guild_id = u.guild_id AND c.discord_id = u.discord_id
+            WHERE u.guild_id = $1 AND u.discord_id = $2
+            GROUP BY u.guild_id, u.discord_id""",
+        "registration": """
+            SELECT twitch_username FROM users
+            WHERE guild_id = $1 AND discord_id = $2""",
+        "discord_id_by_twitch": """
+            SELECT discord_id FROM users
+            WHERE guild_id = $1 AND twitch_username = $2""",
+        "reward_catalog": """
+            SELECT reward_key, name, expiry_hours, position, active FROM reward_catalog
+            WHERE guild_id = $1
+            ORDER BY position, reward_key""",
+        # The rotation query: Shift 2->3, 1->2, then insert the new entry into 1
+        "rotate_log": """
+            UPDATE users
+            SET
+                log_recent_3 = log_recent_2,
+                log_recent_2 = log_recent_1,
+                log_recent_1 = $1
+            WHERE
+                guild_id = $2 AND discord_id = $3""",
+        "increment_reward": """
+            INSERT INTO user_reward_counts (guild_id, discord_id, reward_key, count)
+            VALUES ($1, $2, $3, 1)
+            ON CONFLICT (guild_id, discord_id, reward_key) DO UPDATE
+            SET count = user_reward_counts.count + 1
+            RETURNING count""",
+        "decrement_reward": """
+            UPDATE user_reward_counts
+            SET count = count - 1
+            WHERE guild_id = $1 AND discord_id = $2 AND reward_key = $3
+            RETURNING count""",
+        "lookup_reward": """
+            SELECT u.discord_id, COALESCE(c.count, 0) FROM users u
+            LEFT JOIN user_reward_counts c
+                ON c.guild_id = u.guild_id AND c.discord_id = u.discord_id AND c.reward_key = $3
+            WHERE u.guild_id = $1 AND u.twitch_username = $2""",
+        "expire_reward": """
+            UPDATE user_reward_counts
+            SET count = GREATEST(count - $1, 0)
+            WHERE guild_id = $2 AND discord_id = $3 AND reward_key = $4""",
+        # $5 pre-marks grants too short-lived to warn about (see warn_expiring_grants)
+        "add_grant": """
+            INSERT INTO reward_grants (guild_id, discord_id, reward_column, expires_at, warned)
+            VALUES ($1, $2, $3, NOW() + make_interval(hours => $4), $5)""",
+        # Consume the soonest-expiring grant (if any) so the sweeper doesn't expire a used unit
+        "consume_grant": """
+            DELETE FROM reward_grants
+            WHERE id = (
+                SELECT id FROM reward_grants
+                WHERE guild_id = $1 AND discord_id = $2 AND reward_column = $3
+                ORDER BY expires_at
+                LIMIT 1
+            )""",
+    }
+
+    registry = {}
+    for name, sql in statements.items():
+        param_count = sql.count("$")
+        execute_sql = f"EXECUTE {name}({', '.join(['%s'] * param_count)});" if param_count else f"EXECUTE {name};"
+        registry[name] = (f"PREPARE {name} AS {sql};", execute_sql)
+    return registry
+
+STATEMENTS = build_statement_registry()
+
+def execute_prepared(cursor, name: str, params: tuple = ()):
+    """Runs a registry statement, PREPAREing it first if this connection hasn't seen it yet."""
+    prepare_sql, execute_sql = STATEMENTS[name]
+    prepared = cursor.connection.prepared
+    if name not in prepared:
+        cursor.execute(prepare_sql)
+        prepared.add(name)
+    cursor.execute(execute_sql, params)
+
+def format_log_entry(log_message: str) -> str:
+    """Prepends the Eastern-time timestamp used by every activity log entry."""
+    import pytz
     eastern_time_zone = pytz.timezone('America/New_York')
 
     now_et = datetime.now(eastern_time_zone)
@@ -79,59 +445,223 @@ def log_reward_activity(discord_id: int, log_message: str):
     timestamp = now_et.strftime("%m-%d %H:%M %Z") # %Z gives the timezone name (EST/EDT)
     
     # Prepend the timestamp to the message. The color/sign is already in the message.
-    full_log_entry = f"**[{timestamp}]** {log_message}" 
-    
-    try:
-        # The rotation query: Shift 2->3, 1->2, then insert the new entry into 1
-        update_query = """
-        UPDATE users
-        SET
-            log_recent_3 = log_recent_2,
-            log_recent_2 = log_recent_1,
-            log_recent_1 = %s
-        WHERE
-            discord_id = %s;
-        """
-        cursor.execute(update_query, (full_log_entry, discord_id))
-        conn.commit()
-        
-    except Exception as e:
-        conn.rollback()
-        print(f"FATAL ERROR logging activity for {discord_id}: {e}")
-        
-    finally:
-        cursor.close()
-        conn.close()
+    return f"**[{timestamp}]** {log_message}" 
+
+def log_reward_activity(cursor, guild_id: int, discord_id: int, log_message: str):
+    """
+    Performs the log rotation (shifts log 1 to 2, 2 to 3, and writes new log to 1)
+    on the caller's cursor, so it commits or rolls back with the change being logged.
+    """
+    execute_prepared(cursor, "rotate_log", (format_log_entry(log_message), guild_id, discord_id))
+
+def seed_reward_catalog(cursor, guild_id: int):
+    """Gives a guild the DEFAULT_REWARD_CATALOG if it doesn't have a catalog yet."""
+    cursor.execute("SELECT 1 FROM reward_catalog WHERE guild_id = %s LIMIT 1;", (guild_id,))
+    if cursor.fetchone():
+        return
+    for position, (reward_key, name, expiry_hours) in enumerate(DEFAULT_REWARD_CATALOG):
+        cursor.execute("""
+            INSERT INTO reward_catalog (guild_id, reward_key, name, expiry_hours, position)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT DO NOTHING;
+        """, (guild_id, reward_key, name, expiry_hours, position))
+
+def migrate_legacy_reward_columns(cursor):
+    """
+    One-time copy of the old per-reward users columns (free_points_reward_count, ...) into
+    user_reward_counts. Recorded in schema_migrations so it never runs twice. The old columns
+    are left in place (unused) so the previous release can still be rolled back to.
+    """
+    cursor.execute("SELECT 1 FROM schema_migrations WHERE name = 'legacy_reward_columns';")
+    if cursor.fetchone():
+        return
+
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'users' AND column_name = ANY(%s);
+    """, ([reward_key for reward_key, _, _ in DEFAULT_REWARD_CATALOG],))
+    legacy_columns = [row[0] for row in cursor.fetchall()]
+
+    # Column names come from DEFAULT_REWARD_CATALOG (not user input), so formatting them in is safe
+    for column in legacy_columns:
+        cursor.execute(f"""
+            INSERT INTO user_reward_counts (guild_id, discord_id, reward_key, count)
+            SELECT guild_id, discord_id, %s, {column} FROM users
+            WHERE {column} > 0
+            ON CONFLICT DO NOTHING;
+        """, (column,))
+
+    cursor.execute("INSERT INTO schema_migrations (name) VALUES ('legacy_reward_columns') ON CONFLICT DO NOTHING;")
+    if legacy_columns:
+        print(f"Migrated {len(legacy_columns)} legacy reward column(s) into 'user_reward_counts'.")
 
 def setup_db():
     """
-    Creates the 'users' table if it doesn't already exist and ensures a
-    case-insensitive unique index on twitch_username.
+    Creates the bot's tables ('users', 'guild_admins', 'reward_catalog', 'user_reward_counts',
+    'reward_grants', 'applied_mutations', 'redemption_queue', 'queue_messages',
+    'schema_migrations') if they don't
+    already exist, runs one-time data migrations and ensures a per-guild case-insensitive
+    unique index on twitch_username. Returns True if the schema is ready.
     """
+    import psycopg2.errors
+
     conn = get_db_connection()
     if not conn:
-        return
+        return False
 
     cursor = conn.cursor()
     try:
         # 1. Ensure the main 'users' table exists.
+        # Each guild has its own inventories, so a user is identified by (guild_id, discord_id).
         create_table_query = """
         CREATE TABLE IF NOT EXISTS users (
-            discord_id BIGINT PRIMARY KEY,
-            twitch_username VARCHAR(50) NOT NULL
+            guild_id BIGINT NOT NULL,
+            discord_id BIGINT NOT NULL,
+            twitch_username VARCHAR(50) NOT NULL,
+            PRIMARY KEY (guild_id, discord_id)
         );
         """
         cursor.execute(create_table_query)
+        # The three most recent activity log entries (TEXT, default to NULL)
+        for log_column in LOG_COLUMNS:
+            cursor.execute(f"ALTER TABLE users ADD COLUMN IF NOT EXISTS {log_column} TEXT;")
+
+        # Names of the one-time data migrations that have already run
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(64) PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+
+        # Per-guild admin lists (the bot owner and the guild owner are always admins)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS guild_admins (
+                guild_id BIGINT NOT NULL,
+                discord_id BIGINT NOT NULL,
+                PRIMARY KEY (guild_id, discord_id)
+            );
+        """)
+        cursor.execute(
+            "INSERT INTO guild_admins (guild_id, discord_id) VALUES (%s, %s) ON CONFLICT DO NOTHING;",
+            (GUILD_ID, ADMIN_USER_ID)
+        )
+
+        # 1b. MULTI-GUILD MIGRATION: tables created before multi-guild support keyed users by
+        # discord_id alone. Move those rows into GUILD_ID and widen the primary key.
+        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS guild_id BIGINT;")
+        cursor.execute("UPDATE users SET guild_id = %s WHERE guild_id IS NULL;", (GUILD_ID,))
+        cursor.execute("ALTER TABLE users ALTER COLUMN guild_id SET NOT NULL;")
+        cursor.execute("""
+            SELECT COUNT(*) FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'users'::regclass AND i.indisprimary AND a.attname = 'guild_id';
+        """)
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_pkey;")
+            cursor.execute("ALTER TABLE users ADD PRIMARY KEY (guild_id, discord_id);")
+            print("Migrated 'users' to per-guild primary key (guild_id, discord_id).")
+        # Twitch names only need to be unique within a guild now
+        cursor.execute("DROP INDEX IF EXISTS unique_twitch_username_lower;")
+
+        # 1c. REWARD CATALOG: each guild's rewards (seeded from DEFAULT_REWARD_CATALOG on first use).
+        # Removed rewards are only marked inactive, so re-adding one brings back existing counts.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reward_catalog (
+                guild_id BIGINT NOT NULL,
+                reward_key VARCHAR(64) NOT NULL,
+                name VARCHAR(100) NOT NULL,
+                expiry_hours INT,
+                position INT NOT NULL DEFAULT 0,
+                active BOOLEAN NOT NULL DEFAULT TRUE,
+                PRIMARY KEY (guild_id, reward_key)
+            );
+        """)
+        seed_reward_catalog(cursor, GUILD_ID)
+
+        # Inventories: one row per user per reward they've ever held (no column per reward,
+        # so adding a reward to the catalog needs no DDL)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_reward_counts (
+                guild_id BIGINT NOT NULL,
+                discord_id BIGINT NOT NULL,
+                reward_key VARCHAR(64) NOT NULL,
+                count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, discord_id, reward_key)
+            );
+        """)
+        migrate_legacy_reward_columns(cursor)
+
+        # 1d. EXPIRING GRANTS: one row per granted unit of a reward with expiry_hours set.
+        # The sweeper only ever reads this through the expires_at index (never a full scan).
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reward_grants (
+                id BIGSERIAL PRIMARY KEY,
+                guild_id BIGINT NOT NULL,
+                discord_id BIGINT NOT NULL,
+                reward_column VARCHAR(64) NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS reward_grants_expires_at ON reward_grants (expires_at);")
+        # Set once the viewer has been warned that the grant is about to expire
+        cursor.execute("ALTER TABLE reward_grants ADD COLUMN IF NOT EXISTS warned BOOLEAN NOT NULL DEFAULT FALSE;")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS reward_grants_unwarned
+            ON reward_grants (expires_at) WHERE NOT warned;
+        """)
+        # Used by decrement to consume a user's soonest-expiring unit first
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS reward_grants_user_reward
+            ON reward_grants (guild_id, discord_id, reward_column, expires_at);
+        """)
+
+        # Ids of outbox mutations that have been applied, so replaying one twice is a no-op.
+        # Pruned after OUTBOX_DEDUP_DAYS by the outbox replayer.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS applied_mutations (
+                id VARCHAR(32) PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS applied_mutations_applied_at ON applied_mutations (applied_at);")
+
+        # 1e. REDEMPTION QUEUE: FIFO per guild, ordered by id. Finished entries stay for history,
+        # so the partial index only covers the open ones the bot actually reads.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS redemption_queue (
+                id BIGSERIAL PRIMARY KEY,
+                guild_id BIGINT NOT NULL,
+                discord_id BIGINT NOT NULL,
+                reward_column VARCHAR(64) NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'waiting',
+                requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS redemption_queue_open
+            ON redemption_queue (guild_id, id) WHERE status IN ('waiting', 'active');
+        """)
+        # The pinned message the bot keeps up to date with the queue (one per guild)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS queue_messages (
+                guild_id BIGINT PRIMARY KEY,
+                channel_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL
+            );
+        """)
+        conn.commit()
 
-        # 2. Add a CASE-INSENSITIVE UNIQUE INDEX.
+        # 2. Add a CASE-INSENSITIVE UNIQUE INDEX (per guild).
         # This index will cause any INSERT/UPDATE that results in a duplicate 
-        # (case-insensitive) twitch_username to throw a UniqueViolation error.
+        # (case-insensitive) twitch_username in the same guild to throw a UniqueViolation error.
         try:
             cursor.execute("""
                 CREATE UNIQUE INDEX IF NOT EXISTS 
-                unique_twitch_username_lower 
-                ON users (LOWER(twitch_username));
+                unique_guild_twitch_username_lower 
+                ON users (guild_id, LOWER(twitch_username));
             """)
+            conn.commit()
             print("Successfully created/ensured case-insensitive unique index on twitch_username.")
         
         except psycopg2.errors.ProgrammingError as pe:
@@ -150,105 +680,22 @@ def setup_db():
             print("!!! FATAL DB SETUP ERROR: UNIQUE CONSTRAINT VIOLATION !!!")
             print("The case-insensitive index failed because duplicate Twitch names (e.g., 'name' and 'Name') exist in the table.")
             print("You must manually clean the database using the SQL query below, and then restart the bot.")
-            print("SQL to find duplicates: SELECT LOWER(twitch_username), COUNT(*) FROM users GROUP BY 1 HAVING COUNT(*) > 1;")
+            print("SQL to find duplicates: SELECT guild_id, LOWER(twitch_username), COUNT(*) FROM users GROUP BY 1, 2 HAVING COUNT(*) > 1;")
             print("----------------------------------------------------------------------------------")
-            return
-
-        # --- REWARD COLUMN LOGIC (add more rewards here after adding them above)---
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN free_points_reward_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-            
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN tier_list_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN watch_video_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN replay_analysis_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN album_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN dj_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN song_request_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN shuffle_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN marbles_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
+            return False
 
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN ones_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN jackbox_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN kbm_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN cast_count INT DEFAULT 0;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-        # --- END REWARD COLUMN LOGIC ---
-
-        # --- LOG COLUMN LOGIC ---
-        try:
-            # log_recent_1, log_recent_2, log_recent_3 are TEXT columns (default to NULL)
-            cursor.execute("ALTER TABLE users ADD COLUMN log_recent_1 TEXT;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN log_recent_2 TEXT;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN log_recent_3 TEXT;")
-        except psycopg2.errors.DuplicateColumn:
-            conn.rollback()
-        # --- END LOG COLUMN LOGIC ---
-            
         conn.commit()
         print("Database table 'users' setup and commit complete.")
+        return True
         
     except Exception as e:
         print(f"FATAL ERROR setting up database table or columns: {e}")
+        return False
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
-def save_user_registration(discord_id: int, twitch_username: str):
+def save_user_registration(guild_id: int, discord_id: int, twitch_username: str):
     """
     Saves or updates the user's registration data, ensuring the stored username is lowercase.
     """
@@ -262,10 +709,10 @@ def save_user_registration(discord_id: int, twitch_username: str):
         check_query = """
         SELECT discord_id 
         FROM users 
-        WHERE LOWER(twitch_username) = %s AND discord_id != %s;
+        WHERE guild_id = %s AND LOWER(twitch_username) = %s AND discord_id != %s;
         """
         # Ensure parameters are passed as a tuple in the correct order:
-        cursor.execute(check_query, (twitch_username, discord_id))
+        cursor.execute(check_query, (guild_id, twitch_username, discord_id))
         
         if cursor.fetchone() is not None:
             conn.rollback()
@@ -274,16 +721,21 @@ def save_user_registration(discord_id: int, twitch_username: str):
         # --- STEP 2: PERFORM INSERT/UPDATE (Save the lowercase name) ---
         
         query = """
-        INSERT INTO users (discord_id, twitch_username)
-        VALUES (%s, %s)
-        ON CONFLICT (discord_id) DO UPDATE SET
+        INSERT INTO users (guild_id, discord_id, twitch_username)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (guild_id, discord_id) DO UPDATE SET
             twitch_username = EXCLUDED.twitch_username;
         """
-        cursor.execute(query, (discord_id, twitch_username))
+        cursor.execute(query, (guild_id, discord_id, twitch_username))
 
         action = "updated" if cursor.rowcount == 0 else "registered"
-        
+
+        publish_change(cursor, "registration", guild_id, discord_id)
         conn.commit()
+        note_user_write(guild_id, discord_id)
+        invalidate_registration_cache(guild_id, discord_id)
+        invalidate_display_cache(guild_id, discord_id)
+        refresh_inventory_row(cursor, guild_id, discord_id)
         return True, f"Registration successful (name {action})."
             
     except Exception as e:
@@ -293,103 +745,87 @@ def save_user_registration(discord_id: int, twitch_username: str):
             
     finally:
         cursor.close()
-        conn.close()
-
-def get_user_registration(discord_id: int):
-    """Retrieves the user's registration data from the database."""
-    conn = get_db_connection()
-    if not conn:
-        return None
+        release_db_connection(conn)
 
-    cursor = conn.cursor()
-    try:
-        # SQL statement to select the twitch_username for the given discord_id
-        select_query = """
-        SELECT twitch_username FROM users
-        WHERE discord_id = %s;
-        """
-        cursor.execute(select_query, (discord_id,))
-        
-        # fetchone() returns the next row as a tuple (or None if no row is found)
-        result = cursor.fetchone()
-        
-        # If a result is found, return the username (which is the first element of the tuple)
-        if result:
-            return result[0]
-        else:
-            return None # User not found
-            
-    except Exception as e:
-        print(f"Error retrieving registration from database: {e}")
-        return None
-        
-    finally:
-        cursor.close()
-        conn.close()
+def lookup_user_registration(guild_id: int, discord_id: int):
+    """
+    Retrieves the user's Twitch name (served from the registration cache when possible) as
+    (ok, twitch_username). ok is False if the database couldn't be reached, so callers can tell
+    an outage apart from "not registered" (True, None).
+    """
+    cached = get_cached_registration(guild_id, discord_id)
+    if cached is not None:
+        return True, cached
+
+    # Select the twitch_username for the given discord_id (replica when safe).
+    # The row is a tuple, or None if no row is found
+    ok, result = fetch_one_for_read(guild_id, discord_id, "registration", (guild_id, discord_id))
+    if not ok:
+        return False, None
+
+    # If a result is found, return the username (which is the first element of the tuple)
+    if result:
+        store_cached_registration(guild_id, discord_id, result[0])
+        return True, result[0]
+    else:
+        return True, None # User not found
 
-def get_user_rewards(discord_id: int) -> dict | None:
+def get_user_rewards(guild_id: int, discord_id: int) -> dict | None:
     """
-    Retrieves the user's reward counts AND log entries, returned as a dictionary.
-    Returns None if the user is not found.
+    Retrieves the user's reward counts AND log entries, returned as a dictionary with the
+    counts under "rewards" ({reward_key: count}). Returns None if the user is not found.
     """
-    conn = get_db_connection()
-    if not conn:
+    version = inventory_version(guild_id, discord_id)
+    ok, result = fetch_one_for_read(guild_id, discord_id, "user_rewards", (guild_id, discord_id))
+    if not ok:
         print("Database connection failed in get_user_rewards.")
         return None
 
-    # Get the list of all reward column names
-    reward_columns = VALID_REWARD_COLUMNS
-    
-    log_columns = ["log_recent_1", "log_recent_2", "log_recent_3"]
-    
-    # Combine reward and log columns for the SELECT query
-    all_columns = reward_columns + log_columns
-    
-    select_query = f"""
-    SELECT discord_id, {', '.join(all_columns)} 
-    FROM users
-    WHERE discord_id = %s;
-    """
+    user_rewards = user_rewards_from_row(result) if result else None # None: user not found
+    store_inventory_row(guild_id, discord_id, version, user_rewards)
+    return user_rewards
 
-    cursor = conn.cursor()
-    try:
-        cursor.execute(select_query, (discord_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            return None # User not found
-            
-        # The column names are available via cursor.description
-        column_names = [desc[0] for desc in cursor.description]
-        
-        # Create a dictionary mapping column names to their values
-        user_data = dict(zip(column_names, result))
-        
-        return user_data
-            
-    except Exception as e:
-        print(f"Error retrieving user rewards for {discord_id}: {e}")
-        return None
-            
-    finally:
-        cursor.close()
-        conn.close()
+def user_rewards_from_row(result: tuple) -> dict:
+    """Turns a 'user_rewards' statement row into the get_user_rewards dictionary."""
+    # Create a dictionary mapping column names (fixed by the prepared SELECT) to their values
+    user_rewards = dict(zip(USER_REWARD_FIELDS, result))
+    user_rewards["rewards"] = result[-1]
+    return user_rewards
+
+def record_mutation(cursor, mutation_id: str | None) -> bool:
+    """
+    Claims a mutation id in the caller's transaction. Returns False if it was already applied
+    (e.g. an outbox replay of a change whose original attempt committed after all).
+    """
+    if mutation_id is None:
+        return True
+    cursor.execute("INSERT INTO applied_mutations (id) VALUES (%s) ON CONFLICT DO NOTHING;", (mutation_id,))
+    return cursor.rowcount == 1
 
-def increment_user_reward(twitch_username: str, reward_column: str):
-    """Increments the count for a specific reward column for a given user."""
+def increment_user_reward(guild_id: int, twitch_username: str, reward_key: str, mutation_id: str | None = None):
+    """
+    Increments the count of a catalog reward for a given user. A mutation_id makes the
+    change idempotent: applying the same id twice only changes the count once.
+    """
     twitch_username = twitch_username.lower()
+
+    # Only rewards in the guild's active catalog can be granted. The catalog entry also
+    # gives us the user-friendly reward name and how long each unit stays valid.
+    reward = find_catalog_reward(guild_id, reward_key)
+    if reward is None:
+        return False, f"Unknown reward: {reward_key}"
+
     conn = get_db_connection()
     if not conn:
-        return False, "Database connection failed."
+        return False, DB_UNAVAILABLE_MESSAGE
     
     cursor = conn.cursor()
     try:
-        # IMPORTANT: Column names cannot be parameterized with %s, so we must 
-        # validate the input and format the SQL string. We rely on the calling
-        # function to provide only valid reward_column names.
-        
+        if not record_mutation(cursor, mutation_id):
+            return True, "Already applied."
+
         # 1. Look up the discord_id first using the twitch_username
-        cursor.execute("SELECT discord_id FROM users WHERE twitch_username = %s;", (twitch_username,))
+        execute_prepared(cursor, "discord_id_by_twitch", (guild_id, twitch_username))
         result = cursor.fetchone()
         
         if not result:
@@ -397,57 +833,73 @@ def increment_user_reward(twitch_username: str, reward_column: str):
             
         discord_id = result[0]
         
-        # 2. Increment the specified column count
-        # Ensure the column name is safe and valid before formatting the SQL
-        # This is a critical security step for dynamic column names.
+        # 2. Increment the specified reward count
+        execute_prepared(cursor, "increment_reward", (guild_id, discord_id, reward_key))
+        new_count = cursor.fetchone()[0] # Get the updated count
 
-        if reward_column not in VALID_REWARD_COLUMNS: 
-            return False, f"Invalid reward column name: {reward_column}"
-        
-        update_query = f"""
-        UPDATE users 
-        SET {reward_column} = {reward_column} + 1 
-        WHERE discord_id = %s
-        RETURNING {reward_column};
-        """
+        # Expiring rewards also get a grant row, in the same transaction as the count
+        expiry_hours = reward.expiry_hours
+        if expiry_hours:
+            # A grant that starts inside the warning window would be warned about right after the
+            # "you received" DM, so it's created as already warned
+            skip_warning = expiry_hours <= EXPIRY_WARNING_HOURS
+            execute_prepared(cursor, "add_grant", (guild_id, discord_id, reward_key, expiry_hours, skip_warning))
 
-        # We need the user-friendly reward name, so we look it up from the column value
-        reward_name = next(c.name for c in REWARD_CHOICES if c.value == reward_column)
-        
-        cursor.execute(update_query, (discord_id,))
-        new_count = cursor.fetchone()[0] # Get the updated count
+        log_msg = f"🟢 '{reward.name}' added to inventory."
+        log_reward_activity(cursor, guild_id, discord_id, log_msg)
+
+        publish_change(cursor, "rewards", guild_id, discord_id)
         conn.commit()
+        note_user_write(guild_id, discord_id)
+        invalidate_display_cache(guild_id, discord_id)
 
-        log_msg = f"🟢 '{reward_name}' added to inventory."
-        log_reward_activity(discord_id, log_msg)
-        
-        return True, f"Reward incremented! New count for '{reward_column}' is **{new_count}**."
+        refresh_inventory_row(cursor, guild_id, discord_id)
+
+        expiry_note = f" (expires in {expiry_hours}h if unused)" if expiry_hours else ""
+        record_stream_event(guild_id, "granted", reward.name, discord_id)
+        notify_user(guild_id, discord_id, f"🎁 You received **{reward.name}**! You now have **{new_count}**.{expiry_note}")
+        return True, f"Reward incremented! New count for '{reward.name}' is **{new_count}**.{expiry_note}"
         
     except Exception as e:
+        if is_db_unavailable_error(e):
+            print(f"Database unavailable while incrementing reward for {twitch_username}: {e}")
+            return False, DB_UNAVAILABLE_MESSAGE
+        conn.rollback()
         print(f"Error incrementing reward for {twitch_username}: {e}")
         return False, f"An unexpected database error occurred: {e}"
         
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
-def decrement_user_reward(twitch_username: str, reward_column: str):
+def decrement_user_reward(guild_id: int, twitch_username: str, reward_key: str, mutation_id: str | None = None):
     """
-    Decrements the count for a specific reward column for a given user, 
-    but ensures the count does not drop below zero.
+    Decrements the count of a catalog reward for a given user, 
+    but ensures the count does not drop below zero. Idempotent per mutation_id, like increment.
     """
     # 1. Normalize the input name for lookup (since stored names are lowercase)
     twitch_username = twitch_username.lower()
+
+    # The reward must be in the guild's catalog. Removed rewards still count, so queued
+    # requests for a reward that was taken out of the catalog can still be completed.
+    reward = find_catalog_reward(guild_id, reward_key, include_inactive=True)
+    if reward is None:
+        return False, f"Unknown reward: {reward_key}"
+
     conn = get_db_connection()
     if not conn:
-        return False, "Database connection failed."
+        return False, DB_UNAVAILABLE_MESSAGE
     
     cursor = conn.cursor()
     try:
+        # Checked first: once applied, the count check below could fail for the duplicate
+        if not record_mutation(cursor, mutation_id):
+            return True, "Already applied."
+
         # --- 1. VALIDATION AND LOOKUP ---
         # 1a. Look up the discord_id first using the twitch_username
         # This uses a case-insensitive lookup since all stored names are lowercase
-        cursor.execute("SELECT discord_id, {} FROM users WHERE twitch_username = %s;".format(reward_column), (twitch_username,))
+        execute_prepared(cursor, "lookup_reward", (guild_id, twitch_username, reward_key))
         result = cursor.fetchone()
         
         if not result:
@@ -460,115 +912,1874 @@ def decrement_user_reward(twitch_username: str, reward_column: str):
         if current_count <= 0:
             return False, f"The user **{twitch_username}** currently has **0** rewards of this type. Cannot remove."
 
-        # 1c. Ensure the column name is safe (CRITICAL SECURITY STEP)
-        if reward_column not in VALID_REWARD_COLUMNS: 
-            return False, f"Invalid reward column name: {reward_column}"
-        
         # --- 2. DECREMENT AND COMMIT ---
-    
-        # SQL to decrement the column by 1
-        update_query = f"""
-        UPDATE users 
-        SET {reward_column} = {reward_column} - 1 
-        WHERE discord_id = %s
-        RETURNING {reward_column};
-        """
-
-        # We need the user-friendly reward name, so we look it up from the column value
-        reward_name = next(c.name for c in REWARD_CHOICES if c.value == reward_column)
-        
-        cursor.execute(update_query, (discord_id,))
+        execute_prepared(cursor, "decrement_reward", (guild_id, discord_id, reward_key))
         new_count = cursor.fetchone()[0] # Get the updated count
-        conn.commit()
 
-        log_msg = f"🔴 '{reward_name}' removed from inventory."
-        log_reward_activity(discord_id, log_msg)
+        # Always consume a grant (no-op if there is none): the reward's expiry may have
+        # been changed in the catalog since its units were granted
+        execute_prepared(cursor, "consume_grant", (guild_id, discord_id, reward_key))
+
+        log_msg = f"🔴 '{reward.name}' removed from inventory."
+        log_reward_activity(cursor, guild_id, discord_id, log_msg)
+
+        publish_change(cursor, "rewards", guild_id, discord_id)
+        conn.commit()
+        note_user_write(guild_id, discord_id)
+        invalidate_display_cache(guild_id, discord_id)
+        refresh_inventory_row(cursor, guild_id, discord_id)
+        record_stream_event(guild_id, "removed", reward.name, discord_id)
         
-        return True, f"Reward decremented! New count for '{reward_column}' is **{new_count}**."
+        return True, f"Reward decremented! New count for '{reward.name}' is **{new_count}**."
             
     except Exception as e:
+        if is_db_unavailable_error(e):
+            print(f"Database unavailable while decrementing reward for {twitch_username}: {e}")
+            return False, DB_UNAVAILABLE_MESSAGE
         conn.rollback()
         print(f"Error decrementing reward for {twitch_username}: {e}")
         return False, f"An unexpected database error occurred: {e}"
             
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
-# --- Discord Modal Implementation ---
+def get_guild_admin_ids(guild_id: int) -> set | None:
+    """Returns the set of Discord IDs stored as admins for a guild, or None if the DB couldn't be read."""
+    conn = get_db_connection()
+    if not conn:
+        return None
 
-class TwitchRegistrationModal(discord.ui.Modal, title='Register Your Twitch'):
-    """A Discord Modal for collecting the user's Twitch username."""
-    
-    twitch_username_input = discord.ui.TextInput(
-        label='Your Twitch Username (Case Sensitive)',
-        placeholder='e.g., Shroud or Amouranth',
-        max_length=50,
-        required=True,
-        style=discord.TextStyle.short
-    )
-    
-    async def on_submit(self, interaction: discord.Interaction):
-        """Called when the user submits the modal form."""
-        await interaction.response.defer(ephemeral=True)
-        
-        # Get the input value
-        twitch_name_raw = self.twitch_username_input.value.strip()
-        
-        # Convert to lowercase for saving AND checking ***
-        twitch_name_for_db = twitch_name_raw.lower() 
-        
-        discord_id = interaction.user.id
-        
-        # Save the data (handle the status returned by the DB function)
-        # Pass the lowercase version to the saving function
-        success, message = save_user_registration(discord_id, twitch_name_for_db) 
-        
-        # Send confirmation or error based on the result
-        if success:
-            await interaction.followup.send(
-                # Use the original (raw) name for display in the success message
-                f"✅ **Success!** Your Twitch username (`{twitch_name_raw}`) has been registered and linked to your Discord account. (Stored as lowercase.)",
-                ephemeral=True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT discord_id FROM guild_admins WHERE guild_id = %s;", (guild_id,))
+        return {row[0] for row in cursor.fetchall()}
+
+    except Exception as e:
+        print(f"Error retrieving admins for guild {guild_id}: {e}")
+        return None
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def set_guild_admin(guild_id: int, discord_id: int, is_admin: bool):
+    """Adds or removes a guild admin. Returns (success, message)."""
+    conn = get_db_connection()
+    if not conn:
+        return False, "Database connection failed."
+
+    cursor = conn.cursor()
+    try:
+        if is_admin:
+            cursor.execute(
+                "INSERT INTO guild_admins (guild_id, discord_id) VALUES (%s, %s) ON CONFLICT DO NOTHING;",
+                (guild_id, discord_id)
             )
         else:
-            # The error message from the DB function will use the raw name
-            await interaction.followup.send(
-                f"❌ **Registration Failed:** {message}",
-                ephemeral=True
+            cursor.execute(
+                "DELETE FROM guild_admins WHERE guild_id = %s AND discord_id = %s;",
+                (guild_id, discord_id)
             )
+        changed = cursor.rowcount > 0
+        publish_change(cursor, "admins", guild_id)
+        conn.commit()
+        invalidate_admin_cache(guild_id)
 
-# --- Discord Bot Events and Commands ---
+        if not changed:
+            return False, "Nothing to change (the admin list already reflects this)."
+        return True, "Admin list updated."
 
-@bot.event
-async def on_ready():
-    """Called when the bot connects to Discord."""
-    print(f"Bot connected as {bot.user.name} ({bot.user.id})")
+    except Exception as e:
+        conn.rollback()
+        print(f"Error updating admins for guild {guild_id}: {e}")
+        return False, f"An unexpected database error occurred: {e}"
 
-    # --- Setup the database connection and table on startup ---
-    setup_db()
-    # -----------------------------------------------------------------
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def expire_due_grants(batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    """
+    Expires up to `batch_size` due reward grants in a single transaction: deletes the grants,
+    decrements the matching inventory counts and writes an activity log entry per user/reward.
+    Returns how many grants were expired (so the caller knows whether to run another batch).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        # 1. Claim a batch of due grants via the expires_at index. SKIP LOCKED lets several
+        # processes sweep at once without blocking on (or double-expiring) the same rows.
+        # The catalog join only fetches each reward's name for the activity log.
+        cursor.execute("""
+            WITH expired AS (
+                DELETE FROM reward_grants
+                WHERE id IN (
+                    SELECT id FROM reward_grants
+                    WHERE expires_at <= NOW()
+                    ORDER BY expires_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING guild_id, discord_id, reward_column
+            )
+            SELECT e.guild_id, e.discord_id, e.reward_column, COALESCE(c.name, e.reward_column)
+            FROM expired e
+            LEFT JOIN reward_catalog c ON c.guild_id = e.guild_id AND c.reward_key = e.reward_column;
+        """, (batch_size,))
+        expired_rows = cursor.fetchall()
+        if not expired_rows:
+            conn.rollback()
+            return 0
+
+        # 2. Apply the expirations per user/reward, in the same transaction as the delete
+        expired = Counter(expired_rows)
+        for (guild_id, discord_id, reward_key, reward_name), amount in expired.items():
+            execute_prepared(cursor, "expire_reward", (amount, guild_id, discord_id, reward_key))
+
+            suffix = f" (x{amount})" if amount > 1 else ""
+            log_msg = f"⌛ '{reward_name}' expired unused{suffix}."
+            log_reward_activity(cursor, guild_id, discord_id, log_msg)
+            publish_change(cursor, "rewards", guild_id, discord_id)
+
+        conn.commit()
+
+        for (guild_id, discord_id, _, reward_name), amount in expired.items():
+            note_user_write(guild_id, discord_id)
+            invalidate_display_cache(guild_id, discord_id)
+            record_stream_event(guild_id, "expired", reward_name, discord_id, amount)
+            count_text = f"{amount}x " if amount > 1 else ""
+            notify_user(guild_id, discord_id, f"⌛ {count_text}**{reward_name}** expired unused.")
+
+        print(f"Expired {len(expired_rows)} reward grant(s).")
+        return len(expired_rows)
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error expiring reward grants: {e}")
+        return 0
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def warn_expiring_grants(batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    """
+    DMs viewers about grants expiring within EXPIRY_WARNING_HOURS, marking each grant as warned
+    (in the same statement) so it is only ever announced once. Grants whose whole lifetime fits in
+    the window are created already warned, so they never get a warning on top of their grant DM.
+    Returns how many grants were marked.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        # Reads the partial index of unwarned grants; SKIP LOCKED as in expire_due_grants
+        cursor.execute("""
+            WITH warned AS (
+                UPDATE reward_grants SET warned = TRUE
+                WHERE id IN (
+                    SELECT id FROM reward_grants
+                    WHERE NOT warned AND expires_at <= NOW() + make_interval(hours => %s)
+                    ORDER BY expires_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING guild_id, discord_id, reward_column, expires_at
+            )
+            SELECT w.guild_id, w.discord_id, COALESCE(c.name, w.reward_column), COUNT(*), MIN(w.expires_at)
+            FROM warned w
+            LEFT JOIN reward_catalog c ON c.guild_id = w.guild_id AND c.reward_key = w.reward_column
+            GROUP BY 1, 2, 3;
+        """, (EXPIRY_WARNING_HOURS, batch_size))
+        rows = cursor.fetchall()
+        conn.commit()
+
+        for guild_id, discord_id, reward_name, amount, expires_at in rows:
+            count_text = f"{amount}x " if amount > 1 else ""
+            notify_user(
+                guild_id, discord_id,
+                f"⏰ {count_text}**{reward_name}** expires <t:{int(expires_at.timestamp())}:R>. Use `/redeem` before then!"
+            )
+        return sum(row[3] for row in rows)
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error warning about expiring grants: {e}")
+        return 0
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+# --- Redemption Queue Helpers ---
+
+# Statuses: 'waiting' (in line), 'active' (being used on stream), 'done' and 'skipped' (closed)
+OPEN_QUEUE_STATUSES = ('waiting', 'active')
+
+def enqueue_redemption(guild_id: int, discord_id: int, reward_column: str):
+    """
+    Adds a redemption request to the end of the guild's queue. A user can't have more open
+    requests for a reward than they own. Returns (success, message).
+    """
+    if find_catalog_reward(guild_id, reward_column) is None:
+        return False, f"Unknown reward: {reward_column}"
+
+    conn = get_db_connection()
+    if not conn:
+        return False, "Database connection failed."
+
+    cursor = conn.cursor()
+    try:
+        # 1. Lock the user's row so two quick /redeem calls can't both pass the count check
+        cursor.execute("""
+            SELECT COALESCE(c.count, 0) FROM users u
+            LEFT JOIN user_reward_counts c
+                ON c.guild_id = u.guild_id AND c.discord_id = u.discord_id AND c.reward_key = %s
+            WHERE u.guild_id = %s AND u.discord_id = %s
+            FOR UPDATE OF u;
+        """, (reward_column, guild_id, discord_id))
+        result = cursor.fetchone()
+        if not result:
+            conn.rollback()
+            return False, "You don't appear to be registered yet. Use `/register` first!"
+        owned = result[0] or 0
+
+        cursor.execute("""
+            SELECT COUNT(*) FROM redemption_queue
+            WHERE guild_id = %s AND discord_id = %s AND reward_column = %s AND status IN %s;
+        """, (guild_id, discord_id, reward_column, OPEN_QUEUE_STATUSES))
+        already_queued = cursor.fetchone()[0]
+
+        if already_queued >= owned:
+            conn.rollback()
+            if owned == 0:
+                return False, "You don't have any of this reward to redeem."
+            return False, f"You already have **{already_queued}** request(s) queued for this reward (you own **{owned}**)."
+
+        # 2. Add the request and report the position in line
+        cursor.execute("""
+            INSERT INTO redemption_queue (guild_id, discord_id, reward_column)
+            VALUES (%s, %s, %s)
+            RETURNING id;
+        """, (guild_id, discord_id, reward_column))
+        entry_id = cursor.fetchone()[0]
+
+        cursor.execute("""
+            SELECT COUNT(*) FROM redemption_queue
+            WHERE guild_id = %s AND status IN %s AND id <= %s;
+        """, (guild_id, OPEN_QUEUE_STATUSES, entry_id))
+        position = cursor.fetchone()[0]
+
+        conn.commit()
+        return True, f"You're **#{position}** in the queue (request `#{entry_id}`)."
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error queueing redemption for {discord_id}: {e}")
+        return False, f"An unexpected database error occurred: {e}"
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def get_open_queue(guild_id: int, limit: int = 25):
+    """Returns the guild's open queue entries, oldest first, as (id, discord_id, reward_column, status)."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, discord_id, reward_column, status FROM redemption_queue
+            WHERE guild_id = %s AND status IN %s
+            ORDER BY id
+            LIMIT %s;
+        """, (guild_id, OPEN_QUEUE_STATUSES, limit))
+        return cursor.fetchall()
+
+    except Exception as e:
+        print(f"Error retrieving redemption queue for guild {guild_id}: {e}")
+        return None
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def update_queue_entry(guild_id: int, new_status: str, entry_id: int | None = None):
+    """
+    Moves a queue entry to `new_status` and returns (success, message, entry) where entry is
+    (id, discord_id, reward_column). Without an entry_id, 'active' pops the oldest waiting
+    entry, and 'done'/'skipped' close the current active entry (or the head of the line).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False, "Database connection failed.", None
+
+    cursor = conn.cursor()
+    try:
+        # 1. Pick the entry (SKIP LOCKED: two admins clicking at once get different entries)
+        if entry_id is not None:
+            cursor.execute("""
+                SELECT id FROM redemption_queue
+                WHERE guild_id = %s AND id = %s AND status IN %s
+                FOR UPDATE;
+            """, (guild_id, entry_id, OPEN_QUEUE_STATUSES))
+        elif new_status == 'active':
+            cursor.execute("""
+                SELECT id FROM redemption_queue
+                WHERE guild_id = %s AND status = 'waiting'
+                ORDER BY id LIMIT 1
+                FOR UPDATE SKIP LOCKED;
+            """, (guild_id,))
+        else:
+            cursor.execute("""
+                SELECT id FROM redemption_queue
+                WHERE guild_id = %s AND status IN %s
+                ORDER BY (status = 'active') DESC, id LIMIT 1
+                FOR UPDATE SKIP LOCKED;
+            """, (guild_id, OPEN_QUEUE_STATUSES))
+        result = cursor.fetchone()
+
+        if not result:
+            conn.rollback()
+            if entry_id is not None:
+                return False, f"Request `#{entry_id}` is not open in this server's queue.", None
+            return False, "The queue is empty.", None
+
+        # 2. Update it
+        cursor.execute("""
+            UPDATE redemption_queue SET status = %s
+            WHERE id = %s
+            RETURNING id, discord_id, reward_column;
+        """, (new_status, result[0]))
+        entry = cursor.fetchone()
+        conn.commit()
+        return True, "Queue updated.", entry
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error updating redemption queue for guild {guild_id}: {e}")
+        return False, f"An unexpected database error occurred: {e}", None
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def get_queue_message(guild_id: int):
+    """Returns (channel_id, message_id) of the guild's pinned queue message, or None."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT channel_id, message_id FROM queue_messages WHERE guild_id = %s;", (guild_id,))
+        return cursor.fetchone()
+
+    except Exception as e:
+        print(f"Error retrieving queue message for guild {guild_id}: {e}")
+        return None
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def save_queue_message(guild_id: int, channel_id: int, message_id: int):
+    """Remembers which message the bot should keep updated with the guild's queue."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO queue_messages (guild_id, channel_id, message_id)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                channel_id = EXCLUDED.channel_id,
+                message_id = EXCLUDED.message_id;
+        """, (guild_id, channel_id, message_id))
+        conn.commit()
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error saving queue message for guild {guild_id}: {e}")
+        return False
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+# --- Per-Guild Caches ---
+
+# With CACHE_NOTIFY on (the default), every process LISTENs for change notifications that
+# mutations publish through Postgres NOTIFY, so caches stay correct across gunicorn workers
+# and can use long TTLs. If the listener is down, caches are bypassed until it reconnects.
+# With CACHE_NOTIFY=0 caches fall back to short TTLs and may be briefly stale across processes.
+CACHE_NOTIFY = os.getenv('CACHE_NOTIFY', '1') != '0'
+
+# How long (in seconds) a guild's admin list is trusted before re-reading it from the DB.
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', '600' if CACHE_NOTIFY else '60'))
+# How long (in seconds) a user's registered Twitch name is cached.
+REGISTRATION_CACHE_TTL = float(os.getenv('REGISTRATION_CACHE_TTL', '600' if CACHE_NOTIFY else '60'))
+
+_change_listener_healthy = False
+
+def caches_trusted() -> bool:
+    """False while cross-process invalidation is enabled but not currently connected."""
+    return not CACHE_NOTIFY or _change_listener_healthy
+
+_admin_cache = {}         # guild_id -> (expires_at, set of admin discord_ids)
+_admin_last_known = {}    # guild_id -> last admin list read from the DB, used only while it's unreachable
+_registration_cache = {}  # (guild_id, discord_id) -> (expires_at, twitch_username)
+
+def invalidate_admin_cache(guild_id: int):
+    """Forgets the cached admin list for a guild."""
+    _admin_cache.pop(guild_id, None)
+    _admin_last_known.pop(guild_id, None)
+
+async def is_guild_admin(interaction: discord.Interaction) -> bool | None:
+    """
+    True if the user may run admin commands in the guild the interaction came from, or None if
+    the admin list couldn't be loaded (so callers don't mistake an outage for "not an admin").
+    """
+    user_id = interaction.user.id
+    if user_id == ADMIN_USER_ID:
+        return True
+    if interaction.guild is not None and interaction.guild.owner_id == user_id:
+        return True
+
+    guild_id = interaction.guild_id
+    entry = _admin_cache.get(guild_id) if caches_trusted() else None
+    if entry is None or entry[0] < time.monotonic():
+        # Loaded through the scheduler so a slow DB never blocks the event loop
+        admin_ids = await scheduler.run(PRIORITY_ADMIN, get_guild_admin_ids, guild_id)
+        if admin_ids is None:
+            # Never cached: the next command tries the DB again. Until then, admins we've seen
+            # can still run (and queue) commands during an outage.
+            last_known = _admin_last_known.get(guild_id)
+            if last_known is not None and user_id in last_known:
+                return True
+            return None
+        entry = (time.monotonic() + ADMIN_CACHE_TTL, admin_ids)
+        _admin_cache[guild_id] = entry
+        _admin_last_known[guild_id] = admin_ids
+    return user_id in entry[1]
+
+async def require_guild_admin(interaction: discord.Interaction) -> bool:
+    """Admin check for commands: replies with the reason and returns False if the user can't go ahead."""
+    is_admin = await is_guild_admin(interaction)
+    if is_admin:
+        return True
+
+    if is_admin is None:
+        await interaction.response.send_message(
+            f"⚠️ **Couldn't check your admin access.** {DB_UNAVAILABLE_MESSAGE} Please try again in a moment.",
+            ephemeral=True
+        )
+    else:
+        await interaction.response.send_message(
+            "🛑 **Authorization Failed.** This command is restricted to server admins.",
+            ephemeral=True
+        )
+    return False
+
+def invalidate_registration_cache(guild_id: int, discord_id: int):
+    """Forgets the cached Twitch name for a user."""
+    _registration_cache.pop((guild_id, discord_id), None)
+
+def get_cached_registration(guild_id: int, discord_id: int):
+    """Returns the cached Twitch name for a user, or None if missing/expired/untrusted."""
+    if not caches_trusted():
+        return None
+    entry = _registration_cache.get((guild_id, discord_id))
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+def store_cached_registration(guild_id: int, discord_id: int, twitch_username: str):
+    """Caches a user's Twitch name (only ever called with a confirmed DB value)."""
+    if caches_trusted() and REGISTRATION_CACHE_TTL > 0:
+        _registration_cache[(guild_id, discord_id)] = (time.monotonic() + REGISTRATION_CACHE_TTL, twitch_username)
+
+# How long (in seconds) a rendered /display-rewards response is reused for the same member.
+# Set to 0 to disable caching. Mutations always invalidate the entry immediately.
+DISPLAY_CACHE_TTL = float(os.getenv('DISPLAY_CACHE_TTL', '300' if CACHE_NOTIFY else '15'))
+
+_display_cache = {}       # (guild_id, discord_id) -> (expires_at, payload)
+_display_generation = {}  # (guild_id, discord_id) -> bumped on every mutation so stale lookups are never cached
+_display_epoch = 0        # bumped whenever the whole cache is dropped
+_rewards_inflight = {}    # (guild_id, discord_id, generation) -> asyncio.Future of a running get_user_rewards call
+_display_cache_lock = threading.Lock()
+
+def clear_local_caches():
+    """Drops every cached entry (used when change notifications may have been missed)."""
+    global _display_epoch
+    with _display_cache_lock:
+        _display_cache.clear()
+        _display_epoch += 1
+    _admin_cache.clear()
+    _registration_cache.clear()
+    drop_inventory_snapshot()
+    for guild_id in list(_catalog_cache):
+        invalidate_catalog_cache(guild_id)
+
+def invalidate_display_cache(guild_id: int, discord_id: int):
+    """Drops the cached /display-rewards response for a user. Called after every mutation."""
+    key = (guild_id, discord_id)
+    with _display_cache_lock:
+        _display_cache.pop(key, None)
+        _display_generation[key] = _display_generation.get(key, 0) + 1
+    mark_inventory_stale(guild_id, discord_id)
+
+def get_cached_display(guild_id: int, discord_id: int):
+    """Returns the cached response payload for a user, or None if missing/expired."""
+    key = (guild_id, discord_id)
+    if not caches_trusted():
+        return None
+    with _display_cache_lock:
+        entry = _display_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            del _display_cache[key]
+            return None
+        return payload
+
+def store_cached_display(guild_id: int, discord_id: int, generation: tuple, payload: dict):
+    """Caches a response payload, unless the user was mutated since `generation` was read."""
+    if DISPLAY_CACHE_TTL <= 0 or not caches_trusted():
+        return
+    key = (guild_id, discord_id)
+    now = time.monotonic()
+    with _display_cache_lock:
+        if (_display_epoch, _display_generation.get(key, 0)) != generation:
+            return
+        # Opportunistically drop expired entries so the cache can't grow without bound
+        if len(_display_cache) > 1024:
+            for stale in [k for k, (expires_at, _) in _display_cache.items() if expires_at < now]:
+                del _display_cache[stale]
+        _display_cache[key] = (now + DISPLAY_CACHE_TTL, payload)
+
+async def fetch_user_rewards_shared(guild_id: int, discord_id: int):
+    """
+    Runs get_user_rewards in a worker thread, collapsing concurrent lookups for the
+    same user into a single in-flight query. Returns (generation, user_rewards).
+    """
+    with _display_cache_lock:
+        generation = (_display_epoch, _display_generation.get((guild_id, discord_id), 0))
+
+    key = (guild_id, discord_id, generation)
+    pending = _rewards_inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(scheduler.run(PRIORITY_VIEWER, get_user_rewards, guild_id, discord_id))
+        _rewards_inflight[key] = pending
+        pending.add_done_callback(lambda _f: _rewards_inflight.pop(key, None))
+
+    # shield() so one cancelled interaction doesn't cancel the lookup for everyone else waiting on it
+    return generation, await asyncio.shield(pending)
+
+# --- Inventory Snapshot ---
+# With INVENTORY_SNAPSHOT=1 every inventory is loaded into memory once the change listener is up,
+# and /my-rewards and /display-rewards answer from it on the event loop (no scheduler, thread or
+# query). Rows are compact: reward counts live in an array indexed by per-guild reward ordinals
+# (assigned once, append-only) and the activity log is a tuple. Local mutations re-read the
+# changed row right after committing; changes from other processes (NOTIFY) mark it stale, so the
+# next read goes to the DB and refreshes it. With CACHE_NOTIFY=0 only use this with a single process.
+INVENTORY_SNAPSHOT = os.getenv('INVENTORY_SNAPSHOT', '0') == '1'
+# Rows fetched per round trip while loading the snapshot
+INVENTORY_LOAD_CHUNK = int(os.getenv('INVENTORY_LOAD_CHUNK', '5000'))
+
+class InventoryRow:
+    """
+    One user's inventory: counts by reward ordinal, plus the recent activity log as UTF-8 bytes
+    (log entries contain emoji, which would make Python store the whole str at 4 bytes per character).
+    """
+    __slots__ = ("counts", "logs")
+
+    def __init__(self, counts: array, logs: tuple):
+        self.counts = counts
+        self.logs = logs
+
+    def as_user_rewards(self, discord_id: int, keys: list) -> dict:
+        """The same dictionary get_user_rewards returns (only non-zero counts)."""
+        user_rewards = {"discord_id": discord_id}
+        user_rewards.update((column, log.decode() if log else None) for column, log in zip(LOG_COLUMNS, self.logs))
+        user_rewards["rewards"] = {keys[ordinal]: count for ordinal, count in enumerate(self.counts) if count}
+        return user_rewards
+
+class GuildInventory:
+    """All of one guild's inventories, sharing the guild's reward ordinals."""
+    __slots__ = ("ordinals", "keys", "rows")
+
+    def __init__(self):
+        self.ordinals = {}  # reward_key -> index into every row's counts
+        self.keys = []      # index -> reward_key
+        self.rows = {}      # discord_id -> InventoryRow
+
+    def make_row(self, reward_keys, counts, logs) -> InventoryRow:
+        """Builds a compact row, giving rewards this guild hasn't seen yet the next ordinal."""
+        row_counts = array('i', bytes(4 * len(self.keys)))
+        for reward_key, count in zip(reward_keys, counts):
+            ordinal = self.ordinals.get(reward_key)
+            if ordinal is None:
+                ordinal = self.ordinals[reward_key] = len(self.keys)
+                self.keys.append(reward_key)
+            if ordinal >= len(row_counts):
+                row_counts.extend([0] * (ordinal + 1 - len(row_counts)))
+            row_counts[ordinal] = count
+        return InventoryRow(row_counts, tuple(log.encode() if log else None for log in logs))
+
+_inventory = None         # guild_id -> GuildInventory, or None while not loaded (reads then go to the DB)
+_inventory_stale = set()  # (guild_id, discord_id) changed since snapshotted: read from the DB instead
+_inventory_versions = {}  # (guild_id, discord_id) -> bumped on every change so a racing read isn't stored
+_inventory_generation = 0 # bumped whenever the snapshot is dropped, so an in-flight load is discarded
+_inventory_stats = {"users": 0, "bytes": 0, "load_seconds": 0.0}
+_inventory_lock = threading.Lock()
+
+def mark_inventory_stale(guild_id: int, discord_id: int):
+    """Stops serving a user from the snapshot until their row is re-read. Called on every change."""
+    if not INVENTORY_SNAPSHOT:
+        return
+    key = (guild_id, discord_id)
+    with _inventory_lock:
+        _inventory_versions[key] = _inventory_versions.get(key, 0) + 1
+        _inventory_stale.add(key)
+
+def drop_inventory_snapshot():
+    """Forgets the whole snapshot (used when change notifications may have been missed)."""
+    global _inventory, _inventory_generation
+    with _inventory_lock:
+        _inventory = None
+        _inventory_generation += 1
+
+def inventory_version(guild_id: int, discord_id: int):
+    """The user's change counter, to pass to store_inventory_row (None when the snapshot is off)."""
+    if not INVENTORY_SNAPSHOT:
+        return None
+    with _inventory_lock:
+        return _inventory_versions.get((guild_id, discord_id), 0)
+
+def store_inventory_row(guild_id: int, discord_id: int, version, user_rewards: dict | None):
+    """
+    Puts a freshly read inventory (None = not registered) into the snapshot, unless the user
+    changed again since `version` was taken.
+    """
+    if version is None:
+        return
+    key = (guild_id, discord_id)
+    with _inventory_lock:
+        if _inventory is None or _inventory_versions.get(key, 0) != version:
+            return
+        guild = _inventory.get(guild_id)
+        if guild is None:
+            guild = _inventory[guild_id] = GuildInventory()
+        if user_rewards is None:
+            guild.rows.pop(discord_id, None)
+        else:
+            rewards = user_rewards["rewards"]
+            guild.rows[discord_id] = guild.make_row(
+                rewards.keys(), rewards.values(), (user_rewards.get(column) for column in LOG_COLUMNS)
+            )
+        _inventory_stale.discard(key)
+
+def refresh_inventory_row(cursor, guild_id: int, discord_id: int):
+    """Re-reads a user's row on the caller's cursor right after a committed mutation."""
+    if _inventory is None:
+        return
+    try:
+        version = inventory_version(guild_id, discord_id)
+        execute_prepared(cursor, "user_rewards", (guild_id, discord_id))
+        result = cursor.fetchone()
+        store_inventory_row(guild_id, discord_id, version, user_rewards_from_row(result) if result else None)
+    except Exception as e:
+        # The mutation is already committed; the row just stays stale until it's next read
+        print(f"Failed to refresh inventory snapshot for {discord_id}: {e}")
+
+def lookup_inventory_snapshot(guild_id: int, discord_id: int):
+    """
+    Event-loop safe lookup. Returns (True, user_rewards or None if not registered) when the
+    snapshot can answer, or (False, None) when the caller has to ask the DB.
+    """
+    if _inventory is None or not caches_trusted():
+        return False, None
+    with _inventory_lock:
+        if _inventory is None or (guild_id, discord_id) in _inventory_stale:
+            return False, None
+        guild = _inventory.get(guild_id)
+        row = guild.rows.get(discord_id) if guild is not None else None
+        if row is None:
+            return True, None
+        return True, row.as_user_rewards(discord_id, guild.keys)
+
+def load_inventory_snapshot() -> bool:
+    """Reads every inventory into a new snapshot and swaps it in. Returns True if it loaded."""
+    global _inventory
+    with _inventory_lock:
+        generation = _inventory_generation
+    started = time.perf_counter()
+
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    # A named (server-side) cursor streams the rows in chunks instead of materializing them all
+    cursor = conn.cursor(name="inventory_snapshot")
+    cursor.itersize = INVENTORY_LOAD_CHUNK
+    try:
+        cursor.execute(f"""
+            SELECT u.guild_id, u.discord_id, {', '.join('u.' + column for column in LOG_COLUMNS)},
+                COALESCE(array_agg(c.reward_key) FILTER (WHERE c.count > 0), '{{}}'),
+                COALESCE(array_agg(c.count) FILTER (WHERE c.count > 0), '{{}}')
+            FROM users u
+            LEFT JOIN user_reward_counts c ON c.guild_id = u.guild_id AND c.discord_id = u.discord_id
+            GROUP BY u.guild_id, u.discord_id;
+        """)
+
+        snapshot = {}
+        users = 0
+        approx_bytes = 0
+        log_count = len(LOG_COLUMNS)
+        for row in cursor:
+            guild_id, discord_id = row[0], row[1]
+            guild = snapshot.get(guild_id)
+            if guild is None:
+                guild = snapshot[guild_id] = GuildInventory()
+            logs = row[2:2 + log_count]
+            inventory_row = guild.make_row(row[-2], row[-1], logs)
+            guild.rows[discord_id] = inventory_row
+
+            users += 1
+            # Row object + counts array + log tuple and strings, plus ~100 bytes of dict slot and key
+            approx_bytes += (sys.getsizeof(inventory_row) + sys.getsizeof(inventory_row.counts)
+                             + sys.getsizeof(inventory_row.logs) + sum(sys.getsizeof(log) for log in inventory_row.logs if log) + 100)
+
+    except Exception as e:
+        print(f"Error loading inventory snapshot: {e}")
+        return False
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    with _inventory_lock:
+        if _inventory_generation != generation:
+            print("Inventory snapshot discarded: caches were reset while it was loading.")
+            return False
+        _inventory = snapshot
+
+    elapsed = time.perf_counter() - started
+    _inventory_stats.update(users=users, bytes=approx_bytes, load_seconds=elapsed)
+    per_user = approx_bytes / users if users else 0
+    print(f"Inventory snapshot: {users} user(s) in {elapsed:.2f}s, ~{approx_bytes / 1e6:.1f} MB (~{per_user:.0f} bytes/user).")
+    return True
+
+# --- Cross-Process Cache Invalidation (Postgres LISTEN/NOTIFY) ---
+
+CHANGE_CHANNEL = 'staticrewards_changes'
+# Identifies this process's own notifications, which it has already applied locally
+PROCESS_TOKEN = uuid.uuid4().hex
+
+_change_listener_task = None
+
+def publish_change(cursor, kind: str, guild_id: int, discord_id: int | None = None):
+    """
+    Queues a change notification on the mutation's own transaction. Postgres only delivers
+    it on commit (and drops it on rollback), so listeners never see uncommitted changes.
+    """
+    if not CACHE_NOTIFY:
+        return
+    payload = json.dumps({"kind": kind, "guild_id": guild_id, "discord_id": discord_id, "origin": PROCESS_TOKEN})
+    cursor.execute("SELECT pg_notify(%s, %s);", (CHANGE_CHANNEL, payload))
+
+def apply_change(change: dict):
+    """Invalidates whatever local cache entries a change notification affects."""
+    kind = change.get("kind")
+    guild_id = change.get("guild_id")
+    discord_id = change.get("discord_id")
+
+    # A change made by another process is just as fresh for read-your-writes purposes
+    if discord_id is not None:
+        note_user_write(guild_id, discord_id)
+
+    if kind == "rewards":
+        invalidate_display_cache(guild_id, discord_id)
+    elif kind == "registration":
+        invalidate_registration_cache(guild_id, discord_id)
+        invalidate_display_cache(guild_id, discord_id)
+    elif kind == "admins":
+        invalidate_admin_cache(guild_id)
+    elif kind == "catalog":
+        invalidate_catalog_cache(guild_id)
+
+def connect_change_listener():
+    """Opens the dedicated autocommit connection that LISTENs for change notifications."""
+    import psycopg2
+    import psycopg2.extensions
+    # TCP keepalives make a silently dropped connection show up as a read error
+    conn = psycopg2.connect(DATABASE_URL, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    cursor = conn.cursor()
+    cursor.execute(f"LISTEN {CHANGE_CHANNEL};")
+    cursor.close()
+    return conn
+
+async def run_change_listener():
+    """Keeps a LISTEN connection registered on the event loop for the life of the bot, reconnecting on failure."""
+    global _change_listener_healthy
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            conn = await asyncio.to_thread(connect_change_listener)
+        except Exception as e:
+            print(f"Change listener failed to connect (caches disabled until it does): {e}")
+            await asyncio.sleep(5)
+            continue
+
+        lost = asyncio.Event()
+
+        def on_readable():
+            try:
+                conn.poll()
+            except Exception as e:
+                print(f"Change listener connection lost: {e}")
+                lost.set()
+                return
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    change = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                if change.get("origin") != PROCESS_TOKEN:
+                    apply_change(change)
+
+        loop.add_reader(conn.fileno(), on_readable)
+        # Anything published while we weren't listening was missed, so start from a clean slate
+        clear_local_caches()
+        _change_listener_healthy = True
+        print("Listening for cross-process cache invalidations.")
+        if INVENTORY_SNAPSHOT:
+            # Loaded only now that we're LISTENing, so no change can slip in unnoticed
+            asyncio.create_task(asyncio.to_thread(load_inventory_snapshot))
+
+        try:
+            await lost.wait()
+        finally:
+            _change_listener_healthy = False
+            loop.remove_reader(conn.fileno())
+            conn.close()
+            clear_local_caches()
+
+        await asyncio.sleep(1)
+
+# --- Command Scheduler ---
+# All command DB work runs through one scheduler: at most DB_MAX_CONCURRENCY calls at once,
+# and whenever a slot frees up it goes to the highest-priority waiter. Each priority has a
+# queue limit; past it new work is shed and the user gets a friendly "busy" reply instead.
+
+# /help and /goodbye do no DB work, so they never queue here (they only check is_busy() to degrade).
+
+PRIORITY_ADMIN = 0       # reward mutations and queue management
+PRIORITY_VIEWER = 1      # inventory lookups, registration, /redeem
+PRIORITY_BACKGROUND = 2  # expiry sweeper, queue message refreshes
+
+PRIORITY_NAMES = {
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_VIEWER: "viewer",
+    PRIORITY_BACKGROUND: "background",
+}
+
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', '4'))
+SCHEDULER_QUEUE_LIMITS = {
+    PRIORITY_ADMIN: int(os.getenv('SCHEDULER_ADMIN_QUEUE_LIMIT', '200')),
+    PRIORITY_VIEWER: int(os.getenv('SCHEDULER_VIEWER_QUEUE_LIMIT', '50')),
+    PRIORITY_BACKGROUND: int(os.getenv('SCHEDULER_BACKGROUND_QUEUE_LIMIT', '20')),
+}
+
+class SchedulerOverloaded(Exception):
+    """Raised when a command's priority queue is full and its work is shed."""
+
+    def __init__(self, priority: int):
+        super().__init__(f"{PRIORITY_NAMES[priority]} queue is full")
+        self.priority = priority
+
+class CommandScheduler:
+    """Bounds concurrent DB work and hands each free slot to the highest-priority waiter."""
+
+    def __init__(self, max_concurrency: int, queue_limits: dict):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = queue_limits
+        self.in_flight = 0
+        self.waiting = {priority: 0 for priority in queue_limits}
+        self.shed = {priority: 0 for priority in queue_limits}
+        self.completed = {priority: 0 for priority in queue_limits}
+        self._waiters = []  # heap of (priority, sequence, future); sequence keeps FIFO within a priority
+        self._sequence = itertools.count()
+
+    def is_busy(self) -> bool:
+        """True when every slot is taken, i.e. new work would have to queue."""
+        return self.in_flight >= self.max_concurrency
+
+    async def run(self, priority: int, func, *args):
+        """Runs the blocking `func(*args)` in a worker thread once a slot is granted."""
+        # Commands can arrive while the schema is still being migrated; don't let them see it half-built
+        await wait_for_db_setup()
+        await self._acquire(priority)
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            self.completed[priority] += 1
+            self._release()
+
+    async def _acquire(self, priority: int):
+        # Cancelled waiters can linger in the heap, so check the live counts rather than the heap
+        if self.in_flight < self.max_concurrency and not any(self.waiting.values()):
+            self.in_flight += 1
+            return
+
+        if self.waiting[priority] >= self.queue_limits[priority]:
+            self.shed[priority] += 1
+            raise SchedulerOverloaded(priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self.waiting[priority] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # If the slot was handed over just before we were cancelled, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            self.waiting[priority] -= 1
+
+    def _release(self):
+        # Hand the slot straight to the best waiter (in_flight stays the same), skipping cancelled ones
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self) -> dict:
+        """Snapshot of the scheduler state for /metrics."""
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {PRIORITY_NAMES[p]: n for p, n in self.waiting.items()},
+            "shed_total": {PRIORITY_NAMES[p]: n for p, n in self.shed.items()},
+            "completed_total": {PRIORITY_NAMES[p]: n for p, n in self.completed.items()},
+        }
+
+scheduler = CommandScheduler(DB_MAX_CONCURRENCY, SCHEDULER_QUEUE_LIMITS)
+
+# --- Reward Catalog ---
+# Each guild's catalog is cached per process. Catalog edits publish a "catalog" change, so every
+# process reloads it on next use: new rewards show up in autocomplete and work in every command
+# immediately, with no DDL, redeploy or command re-sync.
+
+RewardItem = namedtuple("RewardItem", ["key", "name", "expiry_hours", "position", "active"])
+
+# How long (in seconds) a guild's catalog is trusted before re-reading it from the DB.
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', '600' if CACHE_NOTIFY else '60'))
+
+class RewardCatalog(list):
+    """
+    A guild's RewardItems in display order (removed ones included), indexed by key and by
+    lower-case name so per-command lookups don't scan the whole catalog.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.by_key = {item.key: item for item in self}
+        # On a name clash the active reward wins, then the one listed first
+        self.by_name = {item.name.lower(): item for item in sorted(reversed(self), key=lambda item: item.active)}
+
+_catalog_cache = {}    # guild_id -> (expires_at, RewardCatalog)
+_catalog_version = {}  # guild_id -> bumped on every catalog change so a load racing an edit isn't cached
+_default_catalog = None
+
+def default_reward_catalog() -> RewardCatalog:
+    """The seed catalog as RewardItems (used only when a guild's real catalog can't be loaded)."""
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = RewardCatalog(
+            RewardItem(reward_key, name, expiry_hours, position, True)
+            for position, (reward_key, name, expiry_hours) in enumerate(DEFAULT_REWARD_CATALOG)
+        )
+    return _default_catalog
+
+def invalidate_catalog_cache(guild_id: int):
+    """
+    Marks a guild's cached catalog as expired. The stale copy is kept for display-only
+    lookups (peek_reward_catalog); cached /display-rewards responses may show old names, so they go too.
+    """
+    global _display_epoch
+    _catalog_version[guild_id] = _catalog_version.get(guild_id, 0) + 1
+    entry = _catalog_cache.get(guild_id)
+    if entry is not None:
+        _catalog_cache[guild_id] = (0, entry[1])
+    with _display_cache_lock:
+        _display_cache.clear()
+        _display_epoch += 1
+
+def load_reward_catalog(guild_id: int):
+    """Reads a guild's catalog from the DB (seeding it on first use). Returns None if the DB is unreachable."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        execute_prepared(cursor, "reward_catalog", (guild_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            seed_reward_catalog(cursor, guild_id)
+            conn.commit()
+            execute_prepared(cursor, "reward_catalog", (guild_id,))
+            rows = cursor.fetchall()
+        return RewardCatalog(RewardItem(*row) for row in rows)
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error loading reward catalog for guild {guild_id}: {e}")
+        return None
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def get_reward_catalog(guild_id: int) -> RewardCatalog:
+    """
+    Returns a guild's catalog (RewardItems in display order, removed ones included), reloading
+    it when the cached copy has expired. May hit the DB, so only call it from worker threads.
+    """
+    entry = _catalog_cache.get(guild_id)
+    if entry is not None and entry[0] >= time.monotonic() and caches_trusted():
+        return entry[1]
+
+    version = _catalog_version.get(guild_id, 0)
+    catalog = load_reward_catalog(guild_id)
+    if catalog is None:
+        # DB unreachable: fall back to the last known catalog (mutations will fail on their own)
+        return entry[1] if entry is not None else default_reward_catalog()
+
+    if _catalog_version.get(guild_id, 0) == version:
+        _catalog_cache[guild_id] = (time.monotonic() + CATALOG_CACHE_TTL, catalog)
+    return catalog
+
+def peek_reward_catalog(guild_id: int) -> RewardCatalog:
+    """Event-loop safe: the cached catalog even if expired (or the defaults), never touching the DB."""
+    entry = _catalog_cache.get(guild_id)
+    return entry[1] if entry is not None else default_reward_catalog()
+
+async def get_reward_catalog_async(guild_id: int, priority: int = PRIORITY_VIEWER) -> RewardCatalog:
+    """Event-loop side of get_reward_catalog: answers from the cache when fresh, else loads it in a worker."""
+    entry = _catalog_cache.get(guild_id)
+    if entry is not None and entry[0] >= time.monotonic() and caches_trusted():
+        return entry[1]
+    try:
+        return await scheduler.run(priority, get_reward_catalog, guild_id)
+    except SchedulerOverloaded:
+        return peek_reward_catalog(guild_id)
+
+def find_catalog_reward(guild_id: int, reward_key: str, include_inactive: bool = False):
+    """Returns the guild's RewardItem for a reward key (worker threads only), or None if it isn't in the catalog."""
+    item = get_reward_catalog(guild_id).by_key.get(reward_key)
+    if item is not None and (item.active or include_inactive):
+        return item
+    return None
+
+def reward_display_name(guild_id: int, reward_key: str) -> str:
+    """User-friendly name of a reward for display (event-loop safe, falls back to the key)."""
+    item = peek_reward_catalog(guild_id).by_key.get(reward_key)
+    return item.name if item is not None else reward_key
+
+def add_catalog_reward(guild_id: int, name: str, expiry_hours: int | None):
+    """
+    Adds a reward to a guild's catalog, or brings back a removed reward with the same name
+    (along with everyone's existing counts of it). Returns (success, message).
+    """
+    name = name.strip()
+    # The key is derived from the name once and never changes (renames only change the name)
+    reward_key = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')[:64]
+    if not reward_key:
+        return False, "The reward name needs at least one letter or number."
+
+    conn = get_db_connection()
+    if not conn:
+        return False, "Database connection failed."
+
+    cursor = conn.cursor()
+    try:
+        # 1. Is there already a reward with this key or name (possibly removed)?
+        cursor.execute("""
+            SELECT reward_key, active FROM reward_catalog
+            WHERE guild_id = %s AND (reward_key = %s OR LOWER(name) = LOWER(%s))
+            FOR UPDATE;
+        """, (guild_id, reward_key, name))
+        existing = cursor.fetchone()
+
+        if existing and existing[1]:
+            conn.rollback()
+            return False, f"**{name}** is already in this server's catalog."
+
+        # 2. Re-activate it, or append a new reward at the end of the catalog
+        if existing:
+            cursor.execute("""
+                UPDATE reward_catalog SET name = %s, expiry_hours = %s, active = TRUE
+                WHERE guild_id = %s AND reward_key = %s;
+            """, (name, expiry_hours, guild_id, existing[0]))
+            action = "restored"
+        else:
+            cursor.execute("""
+                INSERT INTO reward_catalog (guild_id, reward_key, name, expiry_hours, position)
+                SELECT %s, %s, %s, %s, COALESCE(MAX(position) + 1, 0)
+                FROM reward_catalog WHERE guild_id = %s;
+            """, (guild_id, reward_key, name, expiry_hours, guild_id))
+            action = "added"
+
+        publish_change(cursor, "catalog", guild_id)
+        conn.commit()
+        invalidate_catalog_cache(guild_id)
+        return True, f"**{name}** {action}."
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error adding catalog reward for guild {guild_id}: {e}")
+        return False, f"An unexpected database error occurred: {e}"
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def update_catalog_reward(guild_id: int, reward_key: str, name: str | None = None,
+                          expiry_hours: int | None = None, active: bool | None = None):
+    """
+    Changes a catalog reward's name, expiry (0 = never) and/or active flag. None leaves a
+    field unchanged. Returns (success, message).
+    """
+    if name is not None:
+        name = name.strip()
+        if not name:
+            return False, "The reward name can't be blank."
+
+    conn = get_db_connection()
+    if not conn:
+        return False, "Database connection failed."
+
+    cursor = conn.cursor()
+    try:
+        # expiry_hours 0 is stored as NULL (never expires)
+        cursor.execute("""
+            UPDATE reward_catalog SET
+                name = COALESCE(%s, name),
+                expiry_hours = CASE WHEN %s IS NULL THEN expiry_hours ELSE NULLIF(%s, 0) END,
+                active = COALESCE(%s, active)
+            WHERE guild_id = %s AND reward_key = %s
+            RETURNING name;
+        """, (name, expiry_hours, expiry_hours, active, guild_id, reward_key))
+        result = cursor.fetchone()
+        if not result:
+            conn.rollback()
+            return False, f"Unknown reward: {reward_key}"
+
+        publish_change(cursor, "catalog", guild_id)
+        conn.commit()
+        invalidate_catalog_cache(guild_id)
+        return True, f"**{result[0]}** updated."
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error updating catalog reward {reward_key} for guild {guild_id}: {e}")
+        return False, f"An unexpected database error occurred: {e}"
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+async def reward_autocomplete(interaction: discord.Interaction, current: str) -> list:
+    """Autocomplete for every `reward` parameter: the guild's active catalog, filtered by what's typed."""
+    catalog = await get_reward_catalog_async(interaction.guild_id)
+    current = current.lower()
+    return [
+        app_commands.Choice(name=item.name, value=item.key)
+        for item in catalog
+        if item.active and (current in item.name.lower() or current in item.key)
+    ][:25]
+
+async def resolve_reward(interaction: discord.Interaction, reward: str, priority: int, include_inactive: bool = False):
+    """
+    Turns a `reward` argument into the guild's RewardItem. Autocomplete sends the key, but a
+    user can also submit free text, so a case-insensitive name match is accepted too.
+    """
+    catalog = await get_reward_catalog_async(interaction.guild_id, priority)
+    for item in (catalog.by_key.get(reward), catalog.by_name.get(reward.strip().lower())):
+        if item is not None and (item.active or include_inactive):
+            return item
+    return None
+
+# --- Durable Mutation Outbox ---
+# Admin reward changes that can't reach the DB (unreachable, or slower than OUTBOX_TIMEOUT) are
+# appended to a local JSONL journal and fsynced before the admin is told they're queued. A
+# background task replays the journal in order once the DB is back. Every change carries a
+# mutation id recorded in 'applied_mutations', so a change is never applied twice, even if the
+# original (slow) attempt commits after it was journaled.
+
+# Leave OUTBOX_PATH empty to disable the outbox (changes then fail when the DB is down, as before).
+# Processes on one host (e.g. gunicorn workers) can share the file: every access takes an
+# exclusive flock on OUTBOX_PATH.lock, and only one process replays at a time.
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.jsonl')
+# Seconds an admin command waits for the DB before queueing the change instead
+OUTBOX_TIMEOUT = float(os.getenv('OUTBOX_TIMEOUT', '8'))
+# How often (in seconds) the replayer checks the journal, and how many changes it applies per pass
+OUTBOX_REPLAY_INTERVAL = int(os.getenv('OUTBOX_REPLAY_INTERVAL', '5'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+# How long applied mutation ids are kept (replays older than this could apply twice)
+OUTBOX_DEDUP_DAYS = int(os.getenv('OUTBOX_DEDUP_DAYS', '7'))
+
+OUTBOX_QUEUED_MESSAGE = "The database is unavailable right now, so this change was saved and will be applied automatically once it's back."
+
+# Reward mutations the outbox can replay, by journal 'op'
+OUTBOX_OPERATIONS = {
+    "increment": increment_user_reward,
+    "decrement": decrement_user_reward,
+}
+
+_outbox_lock = threading.Lock()  # serializes this process's threads before they take the file lock
+_outbox_pending = 0              # entries this process last saw in the journal (loaded by read_outbox at startup)
+
+@contextlib.contextmanager
+def outbox_file_lock(suffix: str = ".lock", blocking: bool = True):
+    """
+    Holds an flock on a sidecar file next to the journal (the journal itself is swapped out by
+    compaction, so it can't carry the lock). Yields False if `blocking` is off and it's taken.
+    """
+    import fcntl
+    with open(f"{OUTBOX_PATH}{suffix}", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+@contextlib.contextmanager
+def outbox_journal_lock():
+    """Exclusive access to the journal across this process's threads and every other process."""
+    with _outbox_lock, outbox_file_lock():
+        yield
+
+def outbox_has_pending() -> bool:
+    """True while the journal holds changes not yet applied, whichever process queued them."""
+    try:
+        return os.path.getsize(OUTBOX_PATH) > 0
+    except OSError:
+        return False
+
+def append_to_outbox(mutation: dict):
+    """Appends a mutation to the journal and fsyncs it, so it survives a crash or redeploy."""
+    global _outbox_pending
+    line = json.dumps(mutation, separators=(",", ":")) + "\n"
+    with outbox_journal_lock():
+        with open(OUTBOX_PATH, "a+b") as journal:
+            # A crash mid-append can leave a torn last line; start ours on a fresh line
+            if journal.tell() > 0:
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b"\n":
+                    journal.write(b"\n")
+            journal.write(line.encode("utf-8"))
+            journal.flush()
+            os.fsync(journal.fileno())
+        _outbox_pending += 1
+
+def read_outbox() -> list:
+    """Returns the journal's mutations in order, skipping torn or unreadable lines."""
+    with outbox_journal_lock():
+        return read_journal()
+
+def read_journal() -> list:
+    """read_outbox for callers already holding outbox_journal_lock()."""
+    global _outbox_pending
+    entries = []
+    try:
+        with open(OUTBOX_PATH, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    if line.strip():
+                        print(f"Outbox: skipping unreadable journal line: {line.strip()[:80]}")
+    except FileNotFoundError:
+        pass
+    _outbox_pending = len(entries)
+    return entries
+
+def rewrite_outbox(entries: list):
+    """Atomically replaces the journal with `entries` (temp file + fsync + os.replace)."""
+    temp_path = f"{OUTBOX_PATH}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as journal:
+        for entry in entries:
+            journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+    os.replace(temp_path, OUTBOX_PATH)
+
+def apply_mutation(mutation: dict):
+    """Applies one journaled (or live) reward mutation. Returns (success, message)."""
+    operation = OUTBOX_OPERATIONS.get(mutation.get("op"))
+    if operation is None:
+        return False, f"Unknown outbox operation: {mutation.get('op')}"
+    return operation(mutation["guild_id"], mutation["twitch_username"], mutation["reward_key"], mutation["id"])
+
+def replay_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Applies up to `batch_size` journaled mutations in order, each in its own transaction (so one
+    rejected change can't roll back the others), then compacts the journal once for the batch.
+    Stops at the first change the DB still can't take. Returns how many entries were consumed
+    (0 as well if another process is replaying the journal right now).
+    """
+    with outbox_file_lock(".replay.lock", blocking=False) as replaying:
+        if not replaying:
+            return 0
+        entries = read_outbox()[:batch_size]
+
+        consumed_ids = set()
+        for mutation in entries:
+            success, message = apply_mutation(mutation)
+            if not success and message == DB_UNAVAILABLE_MESSAGE:
+                break
+            if not success:
+                # The change itself is invalid now (e.g. the user unregistered): retrying won't help
+                print(f"Outbox: dropped mutation {mutation.get('id')} ({mutation.get('op')} {mutation.get('reward_key')} for {mutation.get('twitch_username')}): {message}")
+            consumed_ids.add(mutation.get("id"))
+
+        if consumed_ids or (not entries and outbox_has_pending()):
+            with outbox_journal_lock():
+                # Re-read: other threads and processes may have appended while the batch replayed.
+                # Dropping by id (rather than by position) also clears out torn lines.
+                remaining = [entry for entry in read_journal() if entry.get("id") not in consumed_ids]
+                rewrite_outbox(remaining)
+            if consumed_ids:
+                print(f"Outbox: replayed {len(consumed_ids)} queued change(s), {len(remaining)} still waiting.")
+        return len(consumed_ids)
+
+def prune_applied_mutations() -> int:
+    """Deletes applied mutation ids older than OUTBOX_DEDUP_DAYS. Returns how many were removed."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM applied_mutations WHERE applied_at < NOW() - make_interval(days => %s);",
+            (OUTBOX_DEDUP_DAYS,)
+        )
+        pruned = cursor.rowcount
+        conn.commit()
+        return pruned
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error pruning applied mutations: {e}")
+        return 0
+
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+async def run_reward_mutation(op: str, guild_id: int, twitch_username: str, reward_key: str):
+    """
+    Applies an admin reward change ("increment"/"decrement"), queueing it in the outbox if the
+    DB is unreachable or slower than OUTBOX_TIMEOUT. Returns (success, message, queued).
+    """
+    mutation = {
+        "id": uuid.uuid4().hex,
+        "op": op,
+        "guild_id": guild_id,
+        "twitch_username": twitch_username.lower(),
+        "reward_key": reward_key,
+        "queued_at": time.time(),
+    }
+
+    # Changes apply in order: while older ones are still waiting in the outbox, new ones queue behind them
+    if not OUTBOX_PATH or not outbox_has_pending():
+        attempt = asyncio.ensure_future(scheduler.run(PRIORITY_ADMIN, apply_mutation, mutation))
+        # If we stop waiting, nobody else will collect the attempt's result
+        attempt.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            success, message = await asyncio.wait_for(asyncio.shield(attempt), OUTBOX_TIMEOUT if OUTBOX_PATH else None)
+            if message != DB_UNAVAILABLE_MESSAGE or not OUTBOX_PATH:
+                return success, message, False
+        except asyncio.TimeoutError:
+            # Still running. If it commits after all, replay finds its id already applied and skips it.
+            print(f"Outbox: {op} {reward_key} for {twitch_username} exceeded {OUTBOX_TIMEOUT}s, queueing it.")
+
+    try:
+        await asyncio.to_thread(append_to_outbox, mutation)
+    except OSError as e:
+        print(f"Outbox: failed to journal mutation {mutation['id']}: {e}")
+        return False, f"{DB_UNAVAILABLE_MESSAGE} The change could not be queued either ({e}).", False
+    return True, OUTBOX_QUEUED_MESSAGE, True
+
+# --- Viewer Notifications (Outbound DM Pipeline) ---
+# Grants, expiries, expiry warnings and stream recaps DM viewers through one queue. Notifications
+# for the same user within NOTIFY_COALESCE_SECONDS are merged into a single message, sends are
+# paced by a token bucket (discord.py still honours Discord's per-route buckets underneath) and
+# failed sends are retried with exponential backoff. Queueing only touches memory, so command
+# handlers and DB worker threads never wait on Discord.
+
+# Set DM_NOTIFICATIONS=0 to stop DMing viewers (stream recaps still post in the channel).
+DM_NOTIFICATIONS = os.getenv('DM_NOTIFICATIONS', '1') != '0'
+# Sustained DMs per second and the burst allowed on top of it
+NOTIFY_RATE = float(os.getenv('NOTIFY_RATE', '2'))
+NOTIFY_BURST = int(os.getenv('NOTIFY_BURST', '5'))
+# How long (in seconds) to wait for more notifications to the same user before sending
+NOTIFY_COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', '5'))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '4'))
+# First retry waits this long (plus jitter); each further retry doubles it
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv('NOTIFY_RETRY_BASE_SECONDS', '2'))
+# Users with a pending DM; notifications for new users past this are dropped
+NOTIFY_MAX_PENDING = int(os.getenv('NOTIFY_MAX_PENDING', '5000'))
+# Lines kept per coalesced DM (the rest are summarized as "...and N more")
+NOTIFY_MAX_LINES = 15
+
+class NotificationPipeline:
+    """Per-user coalescing DM queue with token-bucket pacing and retries, run by one sender task."""
+
+    def __init__(self, rate: float, burst: int, coalesce_seconds: float, max_pending: int):
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_seconds = coalesce_seconds
+        self.max_pending = max_pending
+        self.loop = None
+        self.pending = {}    # discord_id -> {"due": monotonic send time, "lines": [(guild_id, text)], "attempts": int}
+        self._schedule = []  # heap of (due, sequence, discord_id); stale items are skipped
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self.tokens = float(burst)
+        self._tokens_updated = time.monotonic()
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.undeliverable = 0
+
+    def start(self):
+        """Starts the sender task on the running event loop (once)."""
+        if self._task is None:
+            self.loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, guild_id: int, discord_id: int, text: str):
+        """Adds a line to the user's next DM. Event loop only (use notify_user from other threads)."""
+        entry = self.pending.get(discord_id)
+        if entry is None:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            entry = {"due": time.monotonic() + self.coalesce_seconds, "lines": [], "attempts": 0}
+            self.pending[discord_id] = entry
+            self._push(discord_id, entry)
+        entry["lines"].append((guild_id, text))
+
+    def _push(self, discord_id: int, entry: dict):
+        heapq.heappush(self._schedule, (entry["due"], next(self._sequence), discord_id))
+        self._wakeup.set()
+
+    async def _next_due(self):
+        """Waits for the next user whose coalescing window (or retry backoff) is over."""
+        while True:
+            if not self._schedule:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due, _, discord_id = self._schedule[0]
+            entry = self.pending.get(discord_id)
+            if entry is None or entry["due"] != due:
+                heapq.heappop(self._schedule)
+                continue
+
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._schedule)
+            # Anything queued for this user from now on goes into a new DM
+            del self.pending[discord_id]
+            return discord_id, entry
+
+    async def _take_token(self):
+        """Waits until the token bucket allows another send."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._tokens_updated) * self.rate)
+            self._tokens_updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def render(self, lines: list) -> str:
+        """Groups a user's coalesced lines by server into one message."""
+        shown = lines[:NOTIFY_MAX_LINES]
+        by_guild = {}
+        for guild_id, text in shown:
+            by_guild.setdefault(guild_id, []).append(text)
+
+        sections = []
+        for guild_id, texts in by_guild.items():
+            guild = bot.get_guild(guild_id)
+            header = f"**{guild.name}**\n" if guild is not None else ""
+            sections.append(header + "\n".join(texts))
+        if len(lines) > len(shown):
+            sections.append(f"…and {len(lines) - len(shown)} more update(s). Use `/my-rewards` to see your inventory.")
+        return "\n\n".join(sections)[:2000]
+
+    async def _send(self, discord_id: int, entry: dict):
+        """Sends one coalesced DM, rescheduling it with backoff on retryable failures."""
+        try:
+            channel = await bot.create_dm(discord.Object(id=discord_id))
+            await channel.send(self.render(entry["lines"]))
+            self.sent += 1
+            return
+        except (discord.Forbidden, discord.NotFound):
+            # DMs closed or the user is gone: retrying won't help
+            self.undeliverable += 1
+            return
+        except discord.HTTPException as e:
+            if e.status != 429 and e.status < 500:
+                print(f"Dropping DM to {discord_id}: {e}")
+                self.dropped += 1
+                return
+            if e.status == 429:
+                # Rate limited despite the pacing: empty the bucket so everyone slows down
+                self.tokens = 0
+        except Exception as e:
+            print(f"DM to {discord_id} failed (will retry): {e}")
+
+        entry["attempts"] += 1
+        if entry["attempts"] >= NOTIFY_MAX_ATTEMPTS:
+            print(f"Giving up on DM to {discord_id} after {entry['attempts']} attempts.")
+            self.dropped += 1
+            return
+
+        # Back off (with jitter), merging in anything queued for the user in the meantime
+        self.retried += 1
+        backoff = NOTIFY_RETRY_BASE_SECONDS * (2 ** (entry["attempts"] - 1)) * (1 + random.random())
+        newer = self.pending.pop(discord_id, None)
+        if newer is not None:
+            entry["lines"].extend(newer["lines"])
+        entry["due"] = time.monotonic() + backoff
+        self.pending[discord_id] = entry
+        self._push(discord_id, entry)
+
+    async def _run(self):
+        while True:
+            discord_id, entry = await self._next_due()
+            await self._take_token()
+            try:
+                await self._send(discord_id, entry)
+            except Exception as e:
+                print(f"Notification pipeline error for {discord_id}: {e}")
+
+    def metrics(self) -> dict:
+        """Snapshot of the pipeline state for /metrics."""
+        return {
+            "pending": len(self.pending),
+            "sent_total": self.sent,
+            "retried_total": self.retried,
+            "dropped_total": self.dropped,
+            "undeliverable_total": self.undeliverable,
+        }
+
+notifications = NotificationPipeline(NOTIFY_RATE, NOTIFY_BURST, NOTIFY_COALESCE_SECONDS, NOTIFY_MAX_PENDING)
+
+def notify_user(guild_id: int, discord_id: int, text: str):
+    """Queues a DM line for a viewer. Safe to call from DB worker threads; never blocks."""
+    if not DM_NOTIFICATIONS or notifications.loop is None:
+        return
+    notifications.loop.call_soon_threadsafe(notifications.enqueue, guild_id, discord_id, text)
+
+# Per-guild tallies for /stream-recap: everything since the last recap (or since this process started)
+_stream_tallies = {}  # guild_id -> {"since", "granted", "removed", "expired", "viewers"}
+_stream_tallies_lock = threading.Lock()
+
+def record_stream_event(guild_id: int, kind: str, reward_name: str, discord_id: int, amount: int = 1):
+    """Counts a reward event ('granted', 'removed' or 'expired') towards the guild's next stream recap."""
+    with _stream_tallies_lock:
+        tally = _stream_tallies.get(guild_id)
+        if tally is None:
+            tally = {"since": datetime.now(), "granted": Counter(), "removed": Counter(), "expired": Counter(), "viewers": {}}
+            _stream_tallies[guild_id] = tally
+        tally[kind][reward_name] += amount
+        if kind == "granted":
+            tally["viewers"].setdefault(discord_id, Counter())[reward_name] += amount
+
+def take_stream_tally(guild_id: int):
+    """Returns and resets the guild's tallies (None if nothing happened since the last recap)."""
+    with _stream_tallies_lock:
+        return _stream_tallies.pop(guild_id, None)
+
+# --- On-Demand Sampling Profiler ---
+# Samples the stacks of every thread in the process (the discord_bot_thread event loop, the
+# scheduler's worker threads, Flask/gunicorn threads) at a fixed interval. Nothing is hooked
+# when no profile is running, so there is no cost outside of a profile.
+
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_MAX_SECONDS = 60
+# Required to use the /debug/profile HTTP route (the route is disabled when unset)
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+
+_profile_lock = threading.Lock()
+
+def run_sampling_profile(seconds: float, interval: float = PROFILE_INTERVAL):
+    """
+    Samples every thread's stack for `seconds`. Returns (collapsed, summary): `collapsed` is
+    in the folded format flamegraph.pl / speedscope read ("thread;outer;...;inner count" per
+    line) and `summary` lists the top functions. Raises RuntimeError if a profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running.")
+
+    try:
+        sampler_id = threading.get_ident()
+        stacks = Counter()
+        self_samples = Counter()
+        total_samples = Counter()
+        thread_samples = 0
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+
+                functions = []
+                while frame is not None:
+                    code = frame.f_code
+                    functions.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                functions.reverse()
+
+                stacks[";".join([thread_names.get(thread_id, str(thread_id))] + functions)] += 1
+                thread_samples += 1
+                if functions:
+                    self_samples[functions[-1]] += 1
+                    # set(): recursive functions count once per sample
+                    for function in set(functions):
+                        total_samples[function] += 1
+
+            time.sleep(interval)
+
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+        def top(counter):
+            return "\n".join(
+                f"{count / max(thread_samples, 1):6.1%}  {function}" for function, count in counter.most_common(10)
+            ) or "(no samples)"
+
+        summary = (
+            f"{thread_samples} thread samples over {seconds:g}s\n\n"
+            f"Top functions (self):\n{top(self_samples)}\n\n"
+            f"Top functions (inclusive):\n{top(total_samples)}"
+        )
+        return collapsed, summary
+
+    finally:
+        _profile_lock.release()
+
+# --- Discord Modal Implementation ---
+
+class TwitchRegistrationModal(discord.ui.Modal, title='Register Your Twitch'):
+    """A Discord Modal for collecting the user's Twitch username."""
+    
+    twitch_username_input = discord.ui.TextInput(
+        label='Your Twitch Username (Case Sensitive)',
+        placeholder='e.g., Shroud or Amouranth',
+        max_length=50,
+        required=True,
+        style=discord.TextStyle.short
+    )
     
-    # Sync commands to the specified guild (fastest method)
+    async def on_submit(self, interaction: discord.Interaction):
+        """Called when the user submits the modal form."""
+        await interaction.response.defer(ephemeral=True)
+        
+        # Get the input value
+        twitch_name_raw = self.twitch_username_input.value.strip()
+        
+        # Convert to lowercase for saving AND checking ***
+        twitch_name_for_db = twitch_name_raw.lower() 
+        
+        discord_id = interaction.user.id
+        
+        # Save the data (handle the status returned by the DB function)
+        # Pass the lowercase version to the saving function
+        success, message = await scheduler.run(
+            PRIORITY_VIEWER, save_user_registration, interaction.guild_id, discord_id, twitch_name_for_db
+        )
+        
+        # Send confirmation or error based on the result
+        if success:
+            await interaction.followup.send(
+                # Use the original (raw) name for display in the success message
+                f"✅ **Success!** Your Twitch username (`{twitch_name_raw}`) has been registered and linked to your Discord account. (Stored as lowercase.)",
+                ephemeral=True
+            )
+        else:
+            # The error message from the DB function will use the raw name
+            await interaction.followup.send(
+                f"❌ **Registration Failed:** {message}",
+                ephemeral=True
+            )
+
+# --- Discord Bot Events and Commands ---
+
+@bot.event
+async def on_ready():
+    """Called when the bot connects to Discord."""
+    global _change_listener_task
+    record_startup_mark("gateway_ready")
+    print(f"Bot connected as {bot.user.name} ({bot.user.id})")
+
+    # --- Finish the database setup (started alongside login) while commands sync ---
+    await asyncio.gather(ensure_db_setup(), sync_commands())
+    # -----------------------------------------------------------------
+    print(f"Serving {len(bot.guilds)} guild(s) on {len(bot.shards)} shard(s).")
+
+    # on_ready can fire again after a reconnect; only start the background tasks once
+    notifications.start()
+    if not reward_expiry_sweeper.is_running():
+        reward_expiry_sweeper.start()
+
+    if OUTBOX_PATH and not outbox_replayer.is_running():
+        outbox_replayer.start()
+
+    if CACHE_NOTIFY and DATABASE_URL and _change_listener_task is None:
+        _change_listener_task = asyncio.create_task(run_change_listener())
+    elif INVENTORY_SNAPSHOT and not CACHE_NOTIFY and _inventory is None:
+        asyncio.create_task(asyncio.to_thread(load_inventory_snapshot))
+    print("---------------------------------------------")
+
+_db_setup_task = None    # setup_db running in a worker thread, started by run_bot()
+_commands_synced = False
+
+async def ensure_db_setup():
+    """Waits for the schema setup started alongside login (starting it if nothing has yet)."""
+    global _db_setup_task
+    if _db_setup_task is None:
+        _db_setup_task = asyncio.ensure_future(asyncio.to_thread(setup_db))
+    ready = await _db_setup_task
+    record_startup_mark("db_ready")
+    return ready
+
+async def wait_for_db_setup():
+    """Holds DB work until the schema setup started alongside login has finished (no-op otherwise)."""
+    if _db_setup_task is not None and not _db_setup_task.done():
+        try:
+            # Shielded: a command giving up on the wait must not cancel the setup itself
+            await asyncio.shield(_db_setup_task)
+        except Exception:
+            pass  # setup_db reports its own failure; the command then fails (or queues) as usual
+
+async def sync_commands():
+    """Syncs the command tree once per process (not again on every reconnect)."""
+    global _commands_synced
+    # Commands are global (guild_only) so every guild the bot joins gets them. Only the
+    # process running shard 0 syncs, so several processes split by shard range don't all hit the API.
+    if _commands_synced or not (bot.shard_ids is None or 0 in bot.shard_ids):
+        return
     try:
+        # Remove the old guild-specific copies from the single-guild era so they don't show up twice
+        bot.tree.clear_commands(guild=discord.Object(id=GUILD_ID))
         await bot.tree.sync(guild=discord.Object(id=GUILD_ID))
+        await bot.tree.sync()
+        _commands_synced = True
+        record_startup_mark("commands_synced")
         print("Commands synced successfully!")
     except Exception as e:
         print(f"failed to sync commands: {e}")
-    print("---------------------------------------------")
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    """Used only to time the first command served after startup."""
+    record_startup_mark("first_command")
+
+_next_mutation_prune = 0.0  # monotonic time of the next applied_mutations cleanup
+
+@tasks.loop(seconds=OUTBOX_REPLAY_INTERVAL)
+async def outbox_replayer():
+    """Replays queued reward changes in batches until the outbox is empty or the DB stops taking them."""
+    global _next_mutation_prune
+    try:
+        while outbox_has_pending():
+            if await scheduler.run(PRIORITY_BACKGROUND, replay_outbox) == 0:
+                break
+
+        if time.monotonic() >= _next_mutation_prune:
+            _next_mutation_prune = time.monotonic() + 3600
+            await scheduler.run(PRIORITY_BACKGROUND, prune_applied_mutations)
+    except SchedulerOverloaded:
+        # Busy with commands; the journal is durable, so just try again next run
+        return
+
+@tasks.loop(seconds=EXPIRY_SWEEP_INTERVAL)
+async def reward_expiry_sweeper():
+    """Expires due reward grants, then warns about soon-to-expire ones, in batches until none are left."""
+    try:
+        while await scheduler.run(PRIORITY_BACKGROUND, expire_due_grants) >= EXPIRY_BATCH_SIZE:
+            pass
+
+        if DM_NOTIFICATIONS and EXPIRY_WARNING_HOURS > 0:
+            while await scheduler.run(PRIORITY_BACKGROUND, warn_expiring_grants) >= EXPIRY_BATCH_SIZE:
+                pass
+    except SchedulerOverloaded:
+        # Busy with commands; due grants will still be due on the next run
+        return
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="my-rewards", 
     description="View your current inventory of rewards."
 )
+@app_commands.guild_only()
 async def my_rewards_command(interaction: discord.Interaction):
     """Retrieves and displays the user's current reward inventory."""
     
     await interaction.response.defer(ephemeral=True) 
     
     discord_id = interaction.user.id
-    user_rewards = get_user_rewards(discord_id)
+    # Straight from the in-memory snapshot when it can answer, otherwise from the DB
+    found, user_rewards = lookup_inventory_snapshot(interaction.guild_id, discord_id)
+    if not found:
+        user_rewards = await scheduler.run(PRIORITY_VIEWER, get_user_rewards, interaction.guild_id, discord_id)
+    catalog = await get_reward_catalog_async(interaction.guild_id)
     
     # 1) Tell them they're not in the database
     if user_rewards is None:
@@ -581,16 +2792,16 @@ async def my_rewards_command(interaction: discord.Interaction):
     # Prepare the list of rewards with a quantity > 0
     reward_list = []
     
-    # Use the REWARD_CHOICES constant to get the user-friendly name
-    for choice in REWARD_CHOICES:
-        column_name = choice.value
-        display_name = choice.name
+    # Use the guild's reward catalog to get the user-friendly names (in catalog order)
+    for item in catalog:
+        if not item.active:
+            continue
         
-        # The count will be 0 or more (since we set DEFAULT 0 in setup_db)
-        count = user_rewards.get(column_name, 0)
+        # Rewards the user has never held have no row, so default to 0
+        count = user_rewards["rewards"].get(item.key, 0)
         
         if count > 0:
-            reward_list.append(f"• **{display_name}:** {count}")
+            reward_list.append(f"• **{item.name}:** {count}")
             
     # 2) Print out a list of rewards
     if reward_list:
@@ -619,7 +2830,7 @@ async def my_rewards_command(interaction: discord.Interaction):
         else:
             embed.add_field(name="Recent Activity Log", value="No recent activity logged.", inline=False)
         
-        embed.set_footer(text="Let Static know when you want to use them!")
+        embed.set_footer(text="Use /redeem when you want to use them!")
 
         await interaction.followup.send(embed=embed, ephemeral=True)
         
@@ -631,44 +2842,68 @@ async def my_rewards_command(interaction: discord.Interaction):
         )
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="display-rewards", 
     description="View another user's current inventory of rewards (publicly)."
 )
+@app_commands.guild_only()
 @app_commands.describe(
     member="The Discord user whose rewards list you want to view."
 )
 async def display_rewards_command(interaction: discord.Interaction, member: discord.Member):
     """Retrieves and publicly displays another user's current reward inventory."""
-    
-    # 1. Defer the response. Note: We use ephemeral=False (the default) so the response is public.
-    await interaction.response.defer(ephemeral=False) 
-    
+
     discord_id = member.id
-    user_rewards = get_user_rewards(discord_id)
-    
-    # 2. Handle User Not Registered
+
+    # 1. Cache hit: answer immediately, no defer/followup round trip needed.
+    guild_id = interaction.guild_id
+    cached = get_cached_display(guild_id, discord_id)
+    if cached is not None:
+        await interaction.response.send_message(**with_requester_footer(cached, interaction))
+        return
+
+    # 1b. Snapshot hit: render straight from memory, also without a defer
+    found, user_rewards = lookup_inventory_snapshot(guild_id, discord_id)
+    if found and user_rewards is not None:
+        catalog = await get_reward_catalog_async(guild_id)
+        payload = build_display_rewards_payload(member, user_rewards, catalog)
+        await interaction.response.send_message(**with_requester_footer(payload, interaction))
+        return
+
+    # Defer the response. Note: We use ephemeral=False (the default) so the response is public.
+    await interaction.response.defer(ephemeral=False)
+
+    generation, user_rewards = await fetch_user_rewards_shared(guild_id, discord_id)
+    catalog = await get_reward_catalog_async(guild_id)
+
+    # 2. Handle User Not Registered (not cached: None can also mean the DB was unreachable)
     if user_rewards is None:
         await interaction.followup.send(
             f"🛑 **Not Registered.** **{member.display_name}** does not appear to be registered yet. They need to use `/register` to link their Twitch account.",
             ephemeral=False # Public message
         )
         return
-        
+
+    payload = build_display_rewards_payload(member, user_rewards, catalog)
+    store_cached_display(guild_id, discord_id, generation, payload)
+
+    await interaction.followup.send(**with_requester_footer(payload, interaction))
+
+def build_display_rewards_payload(member: discord.Member, user_rewards: dict, catalog: list) -> dict:
+    """Renders the public inventory response for a member as send_message/followup.send kwargs."""
+
     # 3. Prepare the list of rewards with a quantity > 0
     reward_list = []
     
-    # Use the REWARD_CHOICES constant to get the user-friendly name
-    for choice in REWARD_CHOICES:
-        column_name = choice.value
-        display_name = choice.name
+    # Use the guild's reward catalog to get the user-friendly names (in catalog order)
+    for item in catalog:
+        if not item.active:
+            continue
         
         # The count will be 0 or more
-        count = user_rewards.get(column_name, 0)
+        count = user_rewards["rewards"].get(item.key, 0)
         
         if count > 0:
-            # Note: We display the user-friendly name from the REWARD_CHOICES
-            reward_list.append(f"• **{display_name}:** {count}")
+            reward_list.append(f"• **{item.name}:** {count}")
             
     # 4. Print out a list of rewards (if any)
     if reward_list:
@@ -680,52 +2915,63 @@ async def display_rewards_command(interaction: discord.Interaction, member: disc
             color=discord.Color.blue() # Changed color just for visual distinction
         )
         embed.add_field(name="Available Rewards", value=rewards_text, inline=False)
-        embed.set_footer(text=f"Requested by {interaction.user.display_name}")
 
-        await interaction.followup.send(embed=embed, ephemeral=False) # Public response
-        
+        return {"embed": embed} # Public response (footer is added per request)
+
     # 5. Tell them their rewards inventory is empty
-    else:
-        await interaction.followup.send(
-            f"📦 **Inventory Empty!** **{member.display_name}** is registered, but currently has no available rewards to claim.",
-            ephemeral=False # Public message
-        )
+    return {
+        "content": f"📦 **Inventory Empty!** **{member.display_name}** is registered, but currently has no available rewards to claim."
+    }
+
+def with_requester_footer(payload: dict, interaction: discord.Interaction) -> dict:
+    """Stamps the 'Requested by' footer onto a copy of a (possibly cached) display payload."""
+    if "embed" not in payload:
+        return payload
+    embed = payload["embed"].copy()
+    embed.set_footer(text=f"Requested by {interaction.user.display_name}")
+    return {"embed": embed}
 
 # --- ADMIN COMMANDS --- 
 
 # --- ADMIN COMMAND: ADD REWARD (DISCORD MEMBER) ---
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="add-reward", 
     description="[ADMIN ONLY] Adds a reward count to a registered user (by Discord selection)."
 )
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     member="The Discord user (must be registered) of the recipient.",
     reward="The specific reward to be added."
 )
-@app_commands.choices(reward=REWARD_CHOICES)
+@app_commands.autocomplete(reward=reward_autocomplete)
 async def add_reward_discord_command(
     interaction: discord.Interaction, 
     member: discord.Member, 
-    reward: app_commands.Choice[str]
+    reward: str
 ):
     """Admin command to increment a user's reward count by Discord selection."""
     
     # 1. ADMIN CHECK (Authorization)
-    if interaction.user.id != ADMIN_USER_ID:
-        await interaction.response.send_message(
-            "🛑 **Authorization Failed.** This command is restricted to the bot owner.", 
-            ephemeral=True
-        )
+    if not await require_guild_admin(interaction):
         return
 
     await interaction.response.defer(ephemeral=True) 
     
     # 2. Get the recipient's Twitch username using their Discord ID
-    twitch_name = get_user_registration(member.id)
-    
+    found, twitch_name = await scheduler.run(PRIORITY_ADMIN, lookup_user_registration, interaction.guild_id, member.id)
+
+    if not found:
+        # Without the Twitch name there's nothing to queue, so say so rather than "not registered"
+        await interaction.followup.send(
+            f"❌ **Failed to Add Reward** (Via Discord Selection)\n"
+            f"**Reason:** {DB_UNAVAILABLE_MESSAGE} Couldn't look up **{member.display_name}**'s Twitch name, so nothing was changed. "
+            f"Please try again shortly, or use `/add-reward-twitch` (changes made that way are queued until the database is back).",
+            ephemeral=True
+        )
+        return
+
     if twitch_name is None:
         await interaction.followup.send(
             f"❌ **Failed to Add Reward** (Via Discord Selection)\n"
@@ -734,15 +2980,31 @@ async def add_reward_discord_command(
         )
         return
         
-    # Get the database column name from the choice value
-    reward_column = reward.value 
-    reward_name = reward.name
+    # Resolve the (autocompleted) reward against this server's catalog
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_ADMIN)
+    if reward_item is None:
+        await interaction.followup.send(
+            f"❌ **Failed to Add Reward** (Via Discord Selection)\n"
+            f"**Reason:** `{reward}` is not in this server's reward catalog.",
+            ephemeral=True
+        )
+        return
+    reward_column = reward_item.key
+    reward_name = reward_item.name
     
-    # 3. Call the synchronous DB function (Uses the fetched twitch_name)
-    success, message = increment_user_reward(twitch_name, reward_column)
+    # 3. Apply the change (queued in the outbox if the DB is down)
+    success, message, queued = await run_reward_mutation("increment", interaction.guild_id, twitch_name, reward_column)
 
     # 4. Send the response
-    if success:
+    if queued:
+        await interaction.followup.send(
+            f"⏳ **Reward Add Queued** (Via Discord Selection)\n"
+            f"**Recipient:** `{member.display_name}` (Twitch: `{twitch_name}`)\n"
+            f"**Reward:** `{reward_name}`\n"
+            f"**Status:** {message}",
+            ephemeral=True
+        )
+    elif success:
         await interaction.followup.send(
             f"✅ **Reward Added!** (Via Discord Selection)\n"
             f"**Recipient:** `{member.display_name}` (Twitch: `{twitch_name}`)\n"
@@ -760,36 +3022,42 @@ async def add_reward_discord_command(
 # --- ADMIN COMMAND: REMOVE REWARD (DISCORD MEMBER) ---
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="remove-reward", 
     description="[ADMIN ONLY] Subtracts a reward count from a registered user (by Discord selection)."
 )
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     member="The Discord user (must be registered) of the recipient.",
     reward="The specific reward to be removed."
 )
-@app_commands.choices(reward=REWARD_CHOICES)
+@app_commands.autocomplete(reward=reward_autocomplete)
 async def remove_reward_discord_command(
     interaction: discord.Interaction, 
     member: discord.Member, 
-    reward: app_commands.Choice[str]
+    reward: str
 ):
     """Admin command to decrement a user's reward count by Discord selection."""
     
     # 1. ADMIN CHECK (Authorization)
-    if interaction.user.id != ADMIN_USER_ID:
-        await interaction.response.send_message(
-            "🛑 **Authorization Failed.** This command is restricted to the bot owner.", 
-            ephemeral=True
-        )
+    if not await require_guild_admin(interaction):
         return
 
     await interaction.response.defer(ephemeral=True) 
     
     # 2. Get the recipient's Twitch username using their Discord ID
-    twitch_name = get_user_registration(member.id)
-    
+    found, twitch_name = await scheduler.run(PRIORITY_ADMIN, lookup_user_registration, interaction.guild_id, member.id)
+
+    if not found:
+        # Without the Twitch name there's nothing to queue, so say so rather than "not registered"
+        await interaction.followup.send(
+            f"❌ **Failed to Remove Reward** (Via Discord Selection)\n"
+            f"**Reason:** {DB_UNAVAILABLE_MESSAGE} Couldn't look up **{member.display_name}**'s Twitch name, so nothing was changed. "
+            f"Please try again shortly, or use `/remove-reward-twitch` (changes made that way are queued until the database is back).",
+            ephemeral=True
+        )
+        return
+
     if twitch_name is None:
         await interaction.followup.send(
             f"❌ **Failed to Remove Reward** (Via Discord Selection)\n"
@@ -798,15 +3066,31 @@ async def remove_reward_discord_command(
         )
         return
         
-    # Get the database column name from the choice value
-    reward_column = reward.value 
-    reward_name = reward.name
+    # Resolve the (autocompleted) reward against this server's catalog
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_ADMIN, include_inactive=True)
+    if reward_item is None:
+        await interaction.followup.send(
+            f"❌ **Failed to Remove Reward** (Via Discord Selection)\n"
+            f"**Reason:** `{reward}` is not in this server's reward catalog.",
+            ephemeral=True
+        )
+        return
+    reward_column = reward_item.key
+    reward_name = reward_item.name
     
-    # 3. Call the synchronous DB function (Uses the fetched twitch_name)
-    success, message = decrement_user_reward(twitch_name, reward_column)
+    # 3. Apply the change (queued in the outbox if the DB is down)
+    success, message, queued = await run_reward_mutation("decrement", interaction.guild_id, twitch_name, reward_column)
 
     # 4. Send the response
-    if success:
+    if queued:
+        await interaction.followup.send(
+            f"⏳ **Reward Removal Queued** (Via Discord Selection)\n"
+            f"**Recipient:** `{member.display_name}` (Twitch: `{twitch_name}`)\n"
+            f"**Reward:** `{reward_name}`\n"
+            f"**Status:** {message}",
+            ephemeral=True
+        )
+    elif success:
         await interaction.followup.send(
             f"✅ **Reward Removed!** (Via Discord Selection)\n"
             f"**Recipient:** `{member.display_name}` (Twitch: `{twitch_name}`)\n"
@@ -822,43 +3106,55 @@ async def remove_reward_discord_command(
         )
  
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="add-reward-twitch", 
     description="[ADMIN ONLY] Adds a reward count using a Twitch username."
 )
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     twitch_name="The registered Twitch username of the recipient.",
     reward="The specific reward to be added."
 )
-@app_commands.choices(reward=REWARD_CHOICES)
+@app_commands.autocomplete(reward=reward_autocomplete)
 async def add_reward_twitch_command(
     interaction: discord.Interaction, 
     twitch_name: str, 
-    reward: app_commands.Choice[str]
+    reward: str
 ):
     """Admin command to increment a user's reward count by Twitch name."""
     
     # 1. ADMIN CHECK (Authorization)
-    if interaction.user.id != ADMIN_USER_ID:
-        await interaction.response.send_message(
-            "🛑 **Authorization Failed.** This command is restricted to the bot owner.", 
-            ephemeral=True
-        )
+    if not await require_guild_admin(interaction):
         return
 
     # Defer the response as we are talking to the database
     await interaction.response.defer(ephemeral=True) 
     
-    # Get the database column name from the choice value
-    reward_column = reward.value 
-    reward_name = reward.name
+    # Resolve the (autocompleted) reward against this server's catalog
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_ADMIN)
+    if reward_item is None:
+        await interaction.followup.send(
+            f"❌ **Failed to Add Reward** (Via Twitch Name)\n"
+            f"**Reason:** `{reward}` is not in this server's reward catalog.",
+            ephemeral=True
+        )
+        return
+    reward_column = reward_item.key
+    reward_name = reward_item.name
     
-    # 2. Call the synchronous DB function (Uses the input twitch_name)
-    success, message = increment_user_reward(twitch_name.strip(), reward_column)
+    # 2. Apply the change (queued in the outbox if the DB is down)
+    success, message, queued = await run_reward_mutation("increment", interaction.guild_id, twitch_name.strip(), reward_column)
 
     # 3. Send the response
-    if success:
+    if queued:
+        await interaction.followup.send(
+            f"⏳ **Reward Add Queued** (Via Twitch Name)\n"
+            f"**Recipient:** `{twitch_name}`\n"
+            f"**Reward:** `{reward_name}`\n"
+            f"**Status:** {message}",
+            ephemeral=True
+        )
+    elif success:
         await interaction.followup.send(
             f"✅ **Reward Added!** (Via Twitch Name)\n"
             f"**Recipient:** `{twitch_name}`\n"
@@ -877,43 +3173,55 @@ async def add_reward_twitch_command(
 # --- ADMIN COMMAND: REMOVE REWARD --- 
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="remove-reward-twitch", 
     description="[ADMIN ONLY] Subtracts a reward count using a Twitch username."
 )
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     twitch_name="The registered Twitch username of the recipient.",
     reward="The specific reward to be removed."
 )
-@app_commands.choices(reward=REWARD_CHOICES)
+@app_commands.autocomplete(reward=reward_autocomplete)
 async def remove_reward_twitch_command(
     interaction: discord.Interaction, 
     twitch_name: str, 
-    reward: app_commands.Choice[str]
+    reward: str
 ):
     """Admin command to decrement a user's reward count by Twitch name."""
     
     # 1. ADMIN CHECK (Authorization)
-    if interaction.user.id != ADMIN_USER_ID:
-        await interaction.response.send_message(
-            "🛑 **Authorization Failed.** This command is restricted to the bot owner.", 
-            ephemeral=True
-        )
+    if not await require_guild_admin(interaction):
         return
 
     # Defer the response as we are talking to the database
     await interaction.response.defer(ephemeral=True) 
     
-    # Get the database column name from the choice value
-    reward_column = reward.value 
-    reward_name = reward.name
+    # Resolve the (autocompleted) reward against this server's catalog
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_ADMIN, include_inactive=True)
+    if reward_item is None:
+        await interaction.followup.send(
+            f"❌ **Failed to Remove Reward** (Via Twitch Name)\n"
+            f"**Reason:** `{reward}` is not in this server's reward catalog.",
+            ephemeral=True
+        )
+        return
+    reward_column = reward_item.key
+    reward_name = reward_item.name
     
-    # 2. Call the synchronous DB function (Uses the input twitch_name)
-    success, message = decrement_user_reward(twitch_name.strip(), reward_column)
+    # 2. Apply the change (queued in the outbox if the DB is down)
+    success, message, queued = await run_reward_mutation("decrement", interaction.guild_id, twitch_name.strip(), reward_column)
 
     # 3. Send the response
-    if success:
+    if queued:
+        await interaction.followup.send(
+            f"⏳ **Reward Removal Queued** (Via Twitch Name)\n"
+            f"**Recipient:** `{twitch_name}`\n"
+            f"**Reward:** `{reward_name}`\n"
+            f"**Status:** {message}",
+            ephemeral=True
+        )
+    elif success:
         await interaction.followup.send(
             f"✅ **Reward Removed!** (Via Twitch Name)\n"
             f"**Recipient:** `{twitch_name}`\n"
@@ -929,20 +3237,503 @@ async def remove_reward_twitch_command(
             ephemeral=True
         )
 
+# --- ADMIN COMMAND: MANAGE SERVER ADMINS ---
+
+@bot.tree.command(
+    name="admin-add",
+    description="[OWNER ONLY] Allows a member to manage rewards in this server."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(member="The Discord user to make a reward admin.")
+async def admin_add_command(interaction: discord.Interaction, member: discord.Member):
+    """Server owner command to add a reward admin for this guild."""
+    await set_admin_from_command(interaction, member, is_admin=True)
+
+@bot.tree.command(
+    name="admin-remove",
+    description="[OWNER ONLY] Stops a member from managing rewards in this server."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(member="The Discord user to remove as a reward admin.")
+async def admin_remove_command(interaction: discord.Interaction, member: discord.Member):
+    """Server owner command to remove a reward admin for this guild."""
+    await set_admin_from_command(interaction, member, is_admin=False)
+
+async def set_admin_from_command(interaction: discord.Interaction, member: discord.Member, is_admin: bool):
+    """Shared body of /admin-add and /admin-remove."""
+
+    # 1. OWNER CHECK: only the server owner (or the bot owner) manages the admin list
+    is_owner = interaction.guild is not None and interaction.guild.owner_id == interaction.user.id
+    if not is_owner and interaction.user.id != ADMIN_USER_ID:
+        await interaction.response.send_message(
+            "🛑 **Authorization Failed.** This command is restricted to the server owner.",
+            ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    # 2. Update the guild's admin list
+    success, message = await scheduler.run(PRIORITY_ADMIN, set_guild_admin, interaction.guild_id, member.id, is_admin)
+
+    # 3. Send the response
+    if success:
+        action = "is now a reward admin" if is_admin else "is no longer a reward admin"
+        await interaction.followup.send(f"✅ **{member.display_name}** {action} in this server.", ephemeral=True)
+    else:
+        await interaction.followup.send(f"❌ **Admin list unchanged.** {message}", ephemeral=True)
+
+# --- ADMIN COMMAND: MANAGE THE REWARD CATALOG ---
+
+@bot.tree.command(
+    name="catalog-add",
+    description="[ADMIN ONLY] Adds a new reward to this server's catalog."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(
+    name="The reward's name, as viewers will see it.",
+    expiry_hours="Hours each granted unit stays valid if unused (leave empty to never expire)."
+)
+async def catalog_add_command(
+    interaction: discord.Interaction,
+    name: app_commands.Range[str, 1, 100],
+    expiry_hours: app_commands.Range[int, 1, 8760] | None = None
+):
+    """Admin command to add (or restore) a reward in the guild's catalog."""
+    if not await require_guild_admin(interaction):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    success, message = await scheduler.run(PRIORITY_ADMIN, add_catalog_reward, interaction.guild_id, name, expiry_hours)
+
+    if success:
+        await interaction.followup.send(f"✅ **Catalog Updated!** {message} It's available in every command right away.", ephemeral=True)
+    else:
+        await interaction.followup.send(f"❌ **Catalog Unchanged:** {message}", ephemeral=True)
+
+@bot.tree.command(
+    name="catalog-edit",
+    description="[ADMIN ONLY] Renames a reward or changes how long it lasts."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(
+    reward="The reward to change.",
+    new_name="The new name (leave empty to keep the current one).",
+    expiry_hours="Hours each newly granted unit stays valid (0 = never expires, empty = unchanged)."
+)
+@app_commands.autocomplete(reward=reward_autocomplete)
+async def catalog_edit_command(
+    interaction: discord.Interaction,
+    reward: str,
+    new_name: app_commands.Range[str, 1, 100] | None = None,
+    expiry_hours: app_commands.Range[int, 0, 8760] | None = None
+):
+    """Admin command to rename a catalog reward and/or change its expiry."""
+    if new_name is None and expiry_hours is None:
+        await interaction.response.send_message("Nothing to change: give a new name and/or expiry hours.", ephemeral=True)
+        return
+    if new_name is not None:
+        new_name = new_name.strip()
+        if not new_name:
+            await interaction.response.send_message("❌ **Catalog Unchanged:** The new name can't be blank.", ephemeral=True)
+            return
+    await update_catalog_from_command(interaction, reward, new_name=new_name, expiry_hours=expiry_hours)
+
+@bot.tree.command(
+    name="catalog-remove",
+    description="[ADMIN ONLY] Removes a reward from this server's catalog."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(reward="The reward to remove. Viewers' counts are kept and come back if it's re-added.")
+@app_commands.autocomplete(reward=reward_autocomplete)
+async def catalog_remove_command(interaction: discord.Interaction, reward: str):
+    """Admin command to take a reward out of the guild's catalog."""
+    await update_catalog_from_command(interaction, reward, active=False)
+
+async def update_catalog_from_command(interaction: discord.Interaction, reward: str, new_name: str | None = None,
+                                      expiry_hours: int | None = None, active: bool | None = None):
+    """Shared body of /catalog-edit and /catalog-remove."""
+
+    # 1. ADMIN CHECK (Authorization)
+    if not await require_guild_admin(interaction):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    # 2. Resolve the reward and apply the change
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_ADMIN)
+    if reward_item is None:
+        await interaction.followup.send(f"❌ **Catalog Unchanged:** `{reward}` is not in this server's reward catalog.", ephemeral=True)
+        return
+
+    success, message = await scheduler.run(
+        PRIORITY_ADMIN, update_catalog_reward, interaction.guild_id, reward_item.key, new_name, expiry_hours, active
+    )
+
+    # 3. Send the response
+    if success:
+        await interaction.followup.send(f"✅ **Catalog Updated!** {message}", ephemeral=True)
+    else:
+        await interaction.followup.send(f"❌ **Catalog Unchanged:** {message}", ephemeral=True)
+
+@bot.tree.command(
+    name="catalog-list",
+    description="[ADMIN ONLY] Shows this server's reward catalog."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def catalog_list_command(interaction: discord.Interaction):
+    """Admin command to list the guild's catalog, including removed rewards."""
+    if not await require_guild_admin(interaction):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    catalog = await get_reward_catalog_async(interaction.guild_id, PRIORITY_ADMIN)
+
+    def describe(item):
+        expiry = f"expires after {item.expiry_hours}h" if item.expiry_hours else "never expires"
+        return f"• **{item.name}** (`{item.key}`) — {expiry}"
+
+    embed = discord.Embed(title="📋 Reward Catalog", color=discord.Color.gold())
+    active = [describe(item) for item in catalog if item.active]
+    removed = [describe(item) for item in catalog if not item.active]
+    embed.add_field(name="Available Rewards", value=fit_field_lines(active) or "No rewards yet. Use /catalog-add!", inline=False)
+    if removed:
+        embed.add_field(name="Removed (counts kept)", value=fit_field_lines(removed), inline=False)
+
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+# --- REDEMPTION QUEUE ---
+
+# Changes within this many seconds are batched into a single edit of the pinned queue message
+QUEUE_REFRESH_DELAY = float(os.getenv('QUEUE_REFRESH_DELAY', '3'))
+
+_queue_refresh_tasks = {}  # guild_id -> pending asyncio.Task that will edit the queue message
+
+EMBED_FIELD_LIMIT = 1024  # Discord rejects embed field values longer than this
+
+def fit_field_lines(lines: list, limit: int = EMBED_FIELD_LIMIT) -> str:
+    """Joins as many lines as fit in one embed field, ending with a '…and N more' note if some were cut."""
+    kept = []
+    used = 0
+    for index, line in enumerate(lines):
+        remaining = len(lines) - index - 1
+        # Always leave room for the overflow note unless this is the last line
+        reserve = len(f"\n…and {len(lines)} more") if remaining else 0
+        cost = len(line) + (1 if kept else 0)
+        if used + cost + reserve > limit:
+            break
+        kept.append(line)
+        used += cost
+
+    hidden = len(lines) - len(kept)
+    if hidden:
+        kept.append(f"…and {hidden} more")
+    return "\n".join(kept)
+
+def build_queue_embed(guild_id: int, entries: list) -> discord.Embed:
+    """Renders the open queue entries as the pinned queue embed."""
+    embed = discord.Embed(
+        title="🎟️ Reward Redemption Queue",
+        description="Use `/redeem` to get in line for one of your rewards!",
+        color=discord.Color.purple()
+    )
+
+    active = [e for e in entries if e[3] == 'active']
+    waiting = [e for e in entries if e[3] == 'waiting']
+
+    def describe(entry):
+        entry_id, discord_id, reward_column, _ = entry
+        reward_name = reward_display_name(guild_id, reward_column)
+        return f"<@{discord_id}> — **{reward_name}** (`#{entry_id}`)"
+
+    if active:
+        embed.add_field(name="▶️ Now Playing", value=fit_field_lines([describe(e) for e in active]), inline=False)
+
+    if waiting:
+        lines = [f"{position}. {describe(e)}" for position, e in enumerate(waiting, start=1)]
+        embed.add_field(name="Up Next", value=fit_field_lines(lines), inline=False)
+    elif not active:
+        embed.add_field(name="Up Next", value="The queue is empty.", inline=False)
+
+    embed.set_footer(text=f"Last updated {datetime.now().strftime('%H:%M:%S')}")
+    return embed
+
+def schedule_queue_refresh(guild_id: int):
+    """Requests an edit of the guild's queue message; bursts of changes collapse into one edit."""
+    pending = _queue_refresh_tasks.get(guild_id)
+    if pending is not None and not pending.done():
+        return
+    _queue_refresh_tasks[guild_id] = asyncio.create_task(refresh_queue_message(guild_id))
+
+async def refresh_queue_message(guild_id: int):
+    """Waits out the debounce window, then edits the pinned queue message in place."""
+    await asyncio.sleep(QUEUE_REFRESH_DELAY)
+    # Any change from here on schedules a fresh edit, so nothing is missed
+    _queue_refresh_tasks.pop(guild_id, None)
+
+    try:
+        location = await scheduler.run(PRIORITY_BACKGROUND, get_queue_message, guild_id)
+        if not location:
+            return
+        entries = await scheduler.run(PRIORITY_BACKGROUND, get_open_queue, guild_id)
+        if entries is None:
+            return
+    except SchedulerOverloaded:
+        # Try again once things calm down rather than dropping the update
+        schedule_queue_refresh(guild_id)
+        return
+
+    channel_id, message_id = location
+    try:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        await channel.get_partial_message(message_id).edit(embed=build_queue_embed(guild_id, entries))
+    except discord.NotFound:
+        print(f"Queue message for guild {guild_id} was deleted. Use /queue-post to create a new one.")
+    except Exception as e:
+        print(f"Failed to update queue message for guild {guild_id}: {e}")
+
+@bot.tree.command(
+    name="redeem",
+    description="Get in line to use one of your rewards on stream."
+)
+@app_commands.guild_only()
+@app_commands.describe(reward="The reward you want to use.")
+@app_commands.autocomplete(reward=reward_autocomplete)
+async def redeem_command(interaction: discord.Interaction, reward: str):
+    """Places a redemption request for one of the user's rewards into the guild's queue."""
+    await interaction.response.defer(ephemeral=True)
+
+    reward_item = await resolve_reward(interaction, reward, PRIORITY_VIEWER)
+    if reward_item is None:
+        await interaction.followup.send(f"❌ **Couldn't Queue Reward:** `{reward}` is not in this server's reward catalog.", ephemeral=True)
+        return
+
+    success, message = await scheduler.run(
+        PRIORITY_VIEWER, enqueue_redemption, interaction.guild_id, interaction.user.id, reward_item.key
+    )
+
+    if success:
+        schedule_queue_refresh(interaction.guild_id)
+        await interaction.followup.send(f"✅ **Queued!** `{reward_item.name}` — {message}", ephemeral=True)
+    else:
+        await interaction.followup.send(f"❌ **Couldn't Queue Reward:** {message}", ephemeral=True)
+
+@bot.tree.command(
+    name="queue-post",
+    description="[ADMIN ONLY] Posts (and pins) the live redemption queue in this channel."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def queue_post_command(interaction: discord.Interaction):
+    """Admin command to post the queue message the bot keeps updated."""
+
+    # 1. ADMIN CHECK (Authorization)
+    if not await require_guild_admin(interaction):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    # 2. Post the current queue and remember where it is
+    entries = await scheduler.run(PRIORITY_ADMIN, get_open_queue, interaction.guild_id) or []
+    try:
+        message = await interaction.channel.send(embed=build_queue_embed(interaction.guild_id, entries))
+    except discord.HTTPException as e:
+        print(f"Failed to post queue message for guild {interaction.guild_id}: {e}")
+        await interaction.followup.send(
+            "❌ **Couldn't post the queue** in this channel. Check that I can send messages and embeds here.",
+            ephemeral=True
+        )
+        return
+    await scheduler.run(PRIORITY_ADMIN, save_queue_message, interaction.guild_id, message.channel.id, message.id)
+
+    # 3. Pin it (needs Manage Messages; the queue still updates without the pin)
+    try:
+        await message.pin(reason="Live redemption queue")
+        await interaction.followup.send("✅ **Queue posted and pinned!** It will update automatically.", ephemeral=True)
+    except discord.HTTPException:
+        await interaction.followup.send(
+            "⚠️ **Queue posted**, but I couldn't pin it (I need the Manage Messages permission). It will still update automatically.",
+            ephemeral=True
+        )
+
+@bot.tree.command(
+    name="queue-next",
+    description="[ADMIN ONLY] Takes the next request off the redemption queue."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def queue_next_command(interaction: discord.Interaction):
+    """Admin command to pop the oldest waiting request and mark it as in progress."""
+    await update_queue_from_command(interaction, 'active', None)
+
+@bot.tree.command(
+    name="queue-complete",
+    description="[ADMIN ONLY] Marks a request as used and removes the reward from the viewer."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(entry="Request number to complete (defaults to the current one).")
+async def queue_complete_command(interaction: discord.Interaction, entry: int | None = None):
+    """Admin command to complete a request, which also consumes the reward."""
+    await update_queue_from_command(interaction, 'done', entry)
+
+@bot.tree.command(
+    name="queue-skip",
+    description="[ADMIN ONLY] Skips a request without using the viewer's reward."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(entry="Request number to skip (defaults to the current one).")
+async def queue_skip_command(interaction: discord.Interaction, entry: int | None = None):
+    """Admin command to skip a request; the viewer keeps the reward."""
+    await update_queue_from_command(interaction, 'skipped', entry)
+
+async def update_queue_from_command(interaction: discord.Interaction, new_status: str, entry_id: int | None):
+    """Shared body of /queue-next, /queue-complete and /queue-skip."""
+
+    # 1. ADMIN CHECK (Authorization)
+    if not await require_guild_admin(interaction):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    # 2. Move the entry along
+    success, message, entry = await scheduler.run(PRIORITY_ADMIN, update_queue_entry, interaction.guild_id, new_status, entry_id)
+    if not success:
+        await interaction.followup.send(f"❌ **Queue Unchanged:** {message}", ephemeral=True)
+        return
+
+    schedule_queue_refresh(interaction.guild_id)
+    entry_id, discord_id, reward_column = entry
+    reward_name = reward_display_name(interaction.guild_id, reward_column)
+
+    # 3. Completing a request uses up the reward
+    if new_status == 'done':
+        found, twitch_name = await scheduler.run(PRIORITY_ADMIN, lookup_user_registration, interaction.guild_id, discord_id)
+        if not found:
+            status = f"⚠️ Reward not removed: {DB_UNAVAILABLE_MESSAGE} Couldn't look up the viewer's Twitch name; remove it with `/remove-reward` once the database is back."
+        elif twitch_name is None:
+            status = "⚠️ The viewer is no longer registered, so no reward was removed."
+        else:
+            removed, removal_message, _ = await run_reward_mutation("decrement", interaction.guild_id, twitch_name, reward_column)
+            status = removal_message if removed else f"⚠️ Reward not removed: {removal_message}"
+        await interaction.followup.send(
+            f"✅ **Request `#{entry_id}` Completed!** <@{discord_id}> — `{reward_name}`\n**Status:** {status}",
+            ephemeral=True
+        )
+    elif new_status == 'active':
+        await interaction.followup.send(f"▶️ **Up now:** <@{discord_id}> — `{reward_name}` (request `#{entry_id}`)", ephemeral=True)
+    else:
+        await interaction.followup.send(f"⏭️ **Request `#{entry_id}` Skipped.** <@{discord_id}> keeps their `{reward_name}`.", ephemeral=True)
+
+# --- ADMIN COMMAND: STREAM RECAP ---
+
+@bot.tree.command(
+    name="stream-recap",
+    description="[ADMIN ONLY] Posts a recap of this stream's rewards and starts a new tally."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(dm_viewers="Also DM every viewer who earned rewards their personal recap.")
+async def stream_recap_command(interaction: discord.Interaction, dm_viewers: bool = False):
+    """Admin command to post the rewards granted, used and expired since the last recap."""
+
+    # 1. ADMIN CHECK (Authorization)
+    if not await require_guild_admin(interaction):
+        return
+
+    # 2. Take (and reset) the tallies; nothing to do if nothing happened
+    tally = take_stream_tally(interaction.guild_id)
+    if tally is None:
+        await interaction.response.send_message("📭 **Nothing to recap:** no rewards have changed hands since the last recap.", ephemeral=True)
+        return
+
+    def summarize(counter: Counter) -> str:
+        return "\n".join(f"• **{name}:** {count}" for name, count in counter.most_common(10)) or "None"
+
+    embed = discord.Embed(
+        title="📺 Stream Recap",
+        description=f"Rewards since {tally['since'].strftime('%m-%d %H:%M')}",
+        color=discord.Color.purple()
+    )
+    embed.add_field(name="🟢 Granted", value=summarize(tally["granted"]), inline=True)
+    embed.add_field(name="🔴 Used", value=summarize(tally["removed"]), inline=True)
+    embed.add_field(name="⌛ Expired", value=summarize(tally["expired"]), inline=True)
+
+    viewers = tally["viewers"]
+    if viewers:
+        top = sorted(viewers.items(), key=lambda item: sum(item[1].values()), reverse=True)[:5]
+        lines = [f"{rank}. <@{discord_id}> — {sum(rewards.values())}" for rank, (discord_id, rewards) in enumerate(top, start=1)]
+        embed.add_field(name="🏆 Top Earners", value="\n".join(lines), inline=False)
+
+    # 3. Personal recaps go through the DM pipeline (paced, so this returns immediately)
+    if dm_viewers and DM_NOTIFICATIONS:
+        for discord_id, rewards in viewers.items():
+            earned = ", ".join(f"{count}x {name}" for name, count in rewards.most_common())
+            notify_user(interaction.guild_id, discord_id, f"📺 Thanks for watching! This stream you earned: **{earned}**. Use `/redeem` to use them!")
+        embed.set_footer(text=f"Sending personal recaps to {len(viewers)} viewer(s).")
+
+    # 4. Post the recap publicly
+    await interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
+# --- OWNER COMMAND: PROFILE THE LIVE PROCESS ---
+
+@bot.tree.command(
+    name="profile",
+    description="[OWNER ONLY] Samples the bot process for a few seconds and returns a flamegraph-ready profile."
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(seconds="How long to sample for (1-60 seconds).")
+async def profile_command(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 10):
+    """Bot owner command to run the sampling profiler over the live process."""
+
+    # 1. OWNER CHECK: the profile covers every guild the process serves
+    if interaction.user.id != ADMIN_USER_ID:
+        await interaction.response.send_message(
+            "🛑 **Authorization Failed.** This command is restricted to the bot owner.",
+            ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    # 2. Sample from a worker thread so the event loop keeps running (and shows up in the profile)
+    try:
+        collapsed, summary = await asyncio.to_thread(run_sampling_profile, seconds)
+    except RuntimeError as e:
+        await interaction.followup.send(f"❌ **Profile Not Started:** {e}", ephemeral=True)
+        return
+
+    # 3. Send the folded stacks as a file and the top functions inline
+    filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    profile_file = discord.File(io.BytesIO(collapsed.encode()), filename=filename)
+    await interaction.followup.send(
+        f"📈 **Profile complete.** Open the file with speedscope or `flamegraph.pl`.\n```\n{summary[:1800]}\n```",
+        file=profile_file,
+        ephemeral=True
+    )
+
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
-    name="register", 
+    name="register",
     description="Register your Twitch username with the bot."
 )
+@app_commands.guild_only()
 async def register_command(interaction: discord.Interaction):
     """Presents a Modal form to the user to collect their Twitch username."""
     await interaction.response.send_modal(TwitchRegistrationModal())
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID), 
     name="my-twitch-name", 
     description="Shows the Twitch username you have registered with the bot."
 )
+@app_commands.guild_only()
 async def get_registration_command(interaction: discord.Interaction):
     """Retrieves and displays the user's registered Twitch username."""
     # Defer the response, but keep it ephemeral (only the user sees the output)
@@ -951,10 +3742,15 @@ async def get_registration_command(interaction: discord.Interaction):
     discord_id = interaction.user.id
     
     # 1. Call the new synchronous DB function
-    twitch_name = get_user_registration(discord_id) 
+    found, twitch_name = await scheduler.run(PRIORITY_VIEWER, lookup_user_registration, interaction.guild_id, discord_id)
 
     # 2. Construct and send the response
-    if twitch_name:
+    if not found:
+        await interaction.followup.send(
+            "⚠️ **Couldn't check right now.** The database is unavailable, please try again in a moment.",
+            ephemeral=True
+        )
+    elif twitch_name:
         await interaction.followup.send(
             f"🔎 **Found it!** Your registered Twitch username is: `{twitch_name}`",
             ephemeral=True
@@ -967,57 +3763,226 @@ async def get_registration_command(interaction: discord.Interaction):
         )
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID),
     name="help",
     description="Instructions on how to use the bot"
 )
+@app_commands.guild_only()
 async def hello_command(interaction: discord.Interaction):
     """Says hello back to the user."""
-    # Defer the response immediately to beat the 3-second timeout
-    await interaction.response.defer(ephemeral=False)
-
-    # Simulate a small task delay
-    await asyncio.sleep(0.5)
-
-    # Use followup.send() after deferring
-    await interaction.followup.send(f"Hello, {interaction.user.name}! This bot keeps track of your channel point rewards in Static's stream. If Static hasn't manually entered you into the database yet, you can use /register and enter your Twitch name. It doesn't have to be exact, it's just for Static to type in when he's adding/removing rewards to your account. After that it's extremely straightforward - simply use /my-rewards to view rewards you have in the stream! Or, use /display-rewards to view another users rewards!", ephemeral=False)
+    await send_novelty_reply(interaction, f"Hello, {interaction.user.name}! This bot keeps track of your channel point rewards in Static's stream. If Static hasn't manually entered you into the database yet, you can use /register and enter your Twitch name. It doesn't have to be exact, it's just for Static to type in when he's adding/removing rewards to your account. After that it's extremely straightforward - simply use /my-rewards to view rewards you have in the stream! Or, use /display-rewards to view another users rewards!")
 
 @bot.tree.command(
-    guild=discord.Object(id=GUILD_ID),
     name="goodbye",
     description="Says goodbye back to the user!"
 )
+@app_commands.guild_only()
 async def goodbye_command(interaction: discord.Interaction):
     """Says goodbye back to the user."""
+    await send_novelty_reply(interaction, f"fuk u {interaction.user.name}! (Goodbye message)")
+
+async def send_novelty_reply(interaction: discord.Interaction, text: str):
+    """
+    Sends a /help or /goodbye reply. Normally defers and pauses briefly for effect; while
+    the scheduler is busy it degrades to a single immediate send_message (one API call).
+    """
+    if scheduler.is_busy():
+        await interaction.response.send_message(text)
+        return
+
+    # Defer the response immediately to beat the 3-second timeout
     await interaction.response.defer(ephemeral=False)
+
+    # Simulate a small task delay
     await asyncio.sleep(0.5)
-    await interaction.followup.send(f"fuk u {interaction.user.name}! (Goodbye message)", ephemeral=False)
+
+    # Use followup.send() after deferring
+    await interaction.followup.send(text, ephemeral=False)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    """
+    Replies to commands whose work was shed by the scheduler. Anything else is logged with its
+    traceback and the user gets a generic failure reply instead of a hanging "thinking…".
+    """
+    original = getattr(error, "original", error)
+    if isinstance(original, SchedulerOverloaded):
+        message = "⏳ **The bot is very busy right now.** Please try that again in a minute!"
+    else:
+        command_name = interaction.command.name if interaction.command else "unknown"
+        print(f"Error in command /{command_name}: {error}")
+        traceback.print_exception(original)
+        message = "❌ **Something went wrong** while running that command. Please try again later."
+
+    try:
+        if interaction.response.is_done():
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
+    except discord.HTTPException as e:
+        # The interaction may have expired or already been answered
+        print(f"Could not send the error reply: {e}")
+
+# --- Startup Benchmark ---
+
+_startup_marks = {}  # milestone -> seconds since PROCESS_START
+
+def record_startup_mark(name: str):
+    """Records (and prints) the first time a startup milestone is reached."""
+    if name in _startup_marks:
+        return
+    _startup_marks[name] = time.perf_counter() - PROCESS_START
+    print(f"Startup: {name.replace('_', ' ')} after {_startup_marks[name] * 1000:.0f} ms")
+
+    if name == "first_command":
+        report = " | ".join(f"{mark.replace('_', ' ')} {seconds * 1000:.0f} ms" for mark, seconds in _startup_marks.items())
+        print(f"Startup benchmark: {report}")
 
 # --- 3. Flask Web Server Setup ---
-app = Flask(__name__)
+
+def create_app(start_bot_thread: bool = False, bot_in_process: bool = True):
+    """
+    Builds the Flask app (health check, metrics and profiler routes). With start_bot_thread
+    the Discord bot also runs in a background thread of this process (the gunicorn setup).
+    Without a bot in the process (bot_in_process=False, `python main.py web`) only a plain
+    health check is served: the bot's metrics and profiles live in the bot's own process.
+    """
+    from flask import Flask, request
+
+    app = Flask(__name__)
+
+    # 2. Define the Flask Routes
+    if not bot_in_process:
+        @app.route('/')
+        def home():
+            return "Web server is online (the Discord bot runs in a separate process)", 200
+
+        return app
+
+    @app.route('/')
+    def home():
+        if bot.is_ready():
+            return "Bot is online", 200
+        return "Bot is not connected to Discord", 503
+
+    @app.route('/debug/profile')
+    def debug_profile():
+        """
+        Profiles the live process: /debug/profile?seconds=10[&format=summary]. Requires the
+        PROFILE_TOKEN in an X-Profile-Token header; disabled entirely when PROFILE_TOKEN is unset.
+        """
+        supplied = request.headers.get('X-Profile-Token', '')
+        # Compared as bytes: compare_digest raises TypeError on non-ASCII str
+        if not PROFILE_TOKEN or not hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode()):
+            return "Not found", 404
+
+        try:
+            seconds = min(max(float(request.args.get('seconds', '10')), 1), PROFILE_MAX_SECONDS)
+        except ValueError:
+            return "seconds must be a number", 400
+
+        try:
+            collapsed, summary = run_sampling_profile(seconds)
+        except RuntimeError as e:
+            return str(e), 409
+
+        body = summary if request.args.get('format') == 'summary' else collapsed
+        return body, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+    @app.route('/metrics')
+    def metrics():
+        """Scheduler metrics (queue depth per priority, in-flight DB work, shed counts), DM pipeline counters and startup timings in Prometheus text format."""
+        snapshot = scheduler.metrics()
+        lines = [
+            f"staticrewards_scheduler_in_flight {snapshot['in_flight']}",
+            f"staticrewards_scheduler_max_concurrency {snapshot['max_concurrency']}",
+        ]
+        for metric in ("queue_depth", "shed_total", "completed_total"):
+            for priority, value in snapshot[metric].items():
+                lines.append(f'staticrewards_scheduler_{metric}{{priority="{priority}"}} {value}')
+        for metric, value in notifications.metrics().items():
+            lines.append(f"staticrewards_notifications_{metric} {value}")
+        if INVENTORY_SNAPSHOT:
+            lines.append(f"staticrewards_inventory_snapshot_loaded {int(_inventory is not None)}")
+            for metric, value in _inventory_stats.items():
+                lines.append(f"staticrewards_inventory_snapshot_{metric} {value}")
+        for mark, seconds in list(_startup_marks.items()):
+            lines.append(f'staticrewards_startup_seconds{{milestone="{mark}"}} {seconds:.3f}')
+        return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+    if start_bot_thread:
+        # 1. Start the Discord Bot AND DB Setup in the background
+        print("Main Process: Launching Background Tasks...")
+        t = threading.Thread(target=start_bot, name="discord_bot_thread", daemon=True)
+        t.start()
+
+    return app
 
 def start_bot():
     """Starts the Discord bot with explicit logging to see why it's failing."""
     print("Starting Discord Bot thread... attempting login.")
     try:
-        # We re-enable the log_handler to see the Discord errors in Render logs
-        bot.run(token) 
+        asyncio.run(run_bot())
     except Exception as e:
         print(f"DISCORD THREAD ERROR: {e}")
 
-# --- 5. Integrated Startup Sequence ---
+async def run_bot():
+    """Logs in to Discord with the database setup running in parallel instead of before it."""
+    global _db_setup_task
+    # bot.run() used to do this for us; keeps the Discord errors visible in Render logs
+    discord.utils.setup_logging()
+    if OUTBOX_PATH:
+        # Know about changes still queued from a previous run before any command comes in
+        await asyncio.to_thread(read_outbox)
+        if _outbox_pending:
+            print(f"Outbox: {_outbox_pending} queued change(s) from a previous run will be replayed.")
+    async with bot:
+        _db_setup_task = asyncio.ensure_future(asyncio.to_thread(setup_db))
+        await bot.start(token)
+
+def serve_http_in_background(port: int):
+    """Serves the health, metrics and profiler routes from the bot process (`python main.py bot`)."""
+    from werkzeug.serving import make_server
+
+    server = make_server("0.0.0.0", port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="http_thread", daemon=True).start()
+    print(f"Serving health check, /metrics and /debug/profile on port {port}.")
+
+# --- 5. Entry Points ---
+
+def __getattr__(name):
+    """
+    Keeps `gunicorn main:app` working. The app (and the bot thread that runs alongside it)
+    is built the first time `app` is looked up, instead of as a side effect of importing main.py.
+    """
+    if name == "app":
+        app = create_app(start_bot_thread=True)
+        globals()["app"] = app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def main(argv=None):
+    """Command line entry point: python main.py {bot,web,migrate}."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="StaticRewardsBot")
+    parser.add_argument(
+        "mode",
+        choices=["bot", "web", "migrate"],
+        help="bot: run only the Discord bot (plus its health/metrics routes when PORT is set); "
+             "web: run only a plain health-check web server; migrate: set up the database and exit"
+    )
+    args = parser.parse_args(argv)
 
-def run_everything():
-    # We move setup_db INSIDE the thread so it doesn't block Gunicorn
-    setup_db() 
-    start_bot()
+    if args.mode == "migrate":
+        sys.exit(0 if setup_db() else 1)
+    elif args.mode == "web":
+        create_app(bot_in_process=False).run(host="0.0.0.0", port=int(os.getenv("PORT", "10000")))
+    else:
+        if os.getenv("PORT"):
+            serve_http_in_background(int(os.getenv("PORT")))
+        start_bot()
 
-# 1. Start the Discord Bot AND DB Setup in the background
-print("Main Process: Launching Background Tasks...")
-t = threading.Thread(target=run_everything, name="discord_bot_thread", daemon=True)
-t.start()
+record_startup_mark("import")
 
-# 2. Define the Flask Routes (This happens instantly now!)
-@app.route('/')
-def home():
-    return "Bot is online", 200
+if __name__ == "__main__":
+    main()
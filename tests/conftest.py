@@ -0,0 +1,8 @@
+import os
+import sys
+
+# main.py reads its settings at import time: keep the optional background features off
+os.environ.setdefault("DM_NOTIFICATIONS", "0")
+os.environ.setdefault("INVENTORY_SNAPSHOT", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+"""Lookups against a guild's cached reward catalog (no DB: the catalog is served from the process cache)."""
+import asyncio
+import types
+
+import pytest
+
+import main
+
+GUILD = 1
+
+CATALOG = main.RewardCatalog([
+    main.RewardItem("tier_list_count", "Tier List", None, 0, True),
+    main.RewardItem("old_tier_list", "Tier List", None, 1, False),
+    main.RewardItem("vip", "VIP", 24, 2, True),
+    main.RewardItem("retired", "Retired", None, 3, False),
+])
+
+
+@pytest.fixture(autouse=True)
+def cached_catalog(monkeypatch):
+    monkeypatch.setattr(main, "_change_listener_healthy", True)
+    monkeypatch.setitem(main._catalog_cache, GUILD, (float("inf"), CATALOG))
+
+
+def resolve(reward, include_inactive=False):
+    interaction = types.SimpleNamespace(guild_id=GUILD)
+    return asyncio.run(main.resolve_reward(interaction, reward, main.PRIORITY_VIEWER, include_inactive))
+
+
+def test_lookups_by_key_respect_active_flag():
+    assert main.find_catalog_reward(GUILD, "vip").name == "VIP"
+    assert main.find_catalog_reward(GUILD, "retired") is None
+    assert main.find_catalog_reward(GUILD, "retired", include_inactive=True).key == "retired"
+    assert main.find_catalog_reward(GUILD, "missing") is None
+    assert main.reward_display_name(GUILD, "retired") == "Retired"
+    assert main.reward_display_name(GUILD, "missing") == "missing"
+
+
+def test_resolve_reward_by_key_or_name():
+    assert resolve("vip").key == "vip"
+    assert resolve("  vIp ").key == "vip"
+    assert resolve("Retired") is None
+    assert resolve("retired", include_inactive=True).key == "retired"
+    assert resolve("nothing") is None
+
+
+def test_active_reward_wins_a_name_clash():
+    assert resolve("tier list").key == "tier_list_count"
+    assert resolve("tier list", include_inactive=True).key == "tier_list_count"
+    assert resolve("old_tier_list", include_inactive=True).key == "old_tier_list"
+
+
+def test_blank_rename_is_rejected_before_touching_the_db(monkeypatch):
+    monkeypatch.setattr(main, "get_db_connection", lambda *args: pytest.fail("blank name reached the DB"))
+    assert main.update_catalog_reward(GUILD, "vip", name="   ") == (False, "The reward name can't be blank.")
@@ -0,0 +1,60 @@
+"""The app command error handler: every failure gets a reply, unexpected ones are logged with a traceback."""
+import asyncio
+import types
+
+from discord import app_commands
+
+import main
+
+
+class FakeResponse:
+    def __init__(self, done):
+        self.done = done
+        self.sent = []
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content, ephemeral=False):
+        self.sent.append(content)
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content, ephemeral=False):
+        self.sent.append(content)
+
+
+def fake_interaction(deferred):
+    return types.SimpleNamespace(
+        command=types.SimpleNamespace(name="my-rewards"),
+        response=FakeResponse(deferred),
+        followup=FakeFollowup(),
+    )
+
+
+def invoke_error(original):
+    try:
+        raise original
+    except Exception as e:
+        return app_commands.CommandInvokeError(types.SimpleNamespace(name="my-rewards"), e)
+
+
+def test_unexpected_error_after_defer_sends_a_followup_and_logs_the_traceback(capsys):
+    interaction = fake_interaction(deferred=True)
+    asyncio.run(main.on_app_command_error(interaction, invoke_error(KeyError("boom"))))
+
+    assert len(interaction.followup.sent) == 1
+    assert "Something went wrong" in interaction.followup.sent[0]
+    err = capsys.readouterr().err
+    assert "Traceback" in err and "KeyError: 'boom'" in err
+
+
+def test_shed_command_gets_the_busy_reply():
+    interaction = fake_interaction(deferred=False)
+    asyncio.run(main.on_app_command_error(interaction, invoke_error(main.SchedulerOverloaded(main.PRIORITY_VIEWER))))
+
+    assert interaction.followup.sent == []
+    assert "very busy" in interaction.response.sent[0]
@@ -0,0 +1,209 @@
+"""Tests for the outbound DM pipeline, with bot.create_dm stubbed out by a fake Discord endpoint."""
+import asyncio
+import time
+
+import discord
+import pytest
+
+import main
+
+
+class FakeResponse:
+    """The bits of an aiohttp response discord.HTTPException reads."""
+
+    def __init__(self, status):
+        self.status = status
+        self.reason = "fake"
+
+
+class FakeDiscord:
+    """Records every DM send; `failures` maps discord_id to the statuses its next sends fail with."""
+
+    def __init__(self):
+        self.sent = []      # (monotonic time, discord_id, content)
+        self.attempts = {}  # discord_id -> send attempts
+        self.failures = {}
+
+    async def create_dm(self, user):
+        return FakeChannel(self, user.id)
+
+
+class FakeChannel:
+    def __init__(self, endpoint, discord_id):
+        self.endpoint = endpoint
+        self.discord_id = discord_id
+
+    async def send(self, content):
+        endpoint = self.endpoint
+        endpoint.attempts[self.discord_id] = endpoint.attempts.get(self.discord_id, 0) + 1
+        statuses = endpoint.failures.get(self.discord_id)
+        if statuses:
+            status = statuses.pop(0)
+            if status == 403:
+                raise discord.Forbidden(FakeResponse(403), "Cannot send messages to this user")
+            raise discord.HTTPException(FakeResponse(status), "fake failure")
+        endpoint.sent.append((time.monotonic(), self.discord_id, content))
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeDiscord()
+    monkeypatch.setattr(main.bot, "create_dm", fake.create_dm)
+    monkeypatch.setattr(main, "NOTIFY_RETRY_BASE_SECONDS", 0.01)
+    return fake
+
+
+async def run_until(pipeline, done, timeout=10):
+    """Starts the pipeline and waits until `done()` is true, then stops it."""
+    pipeline.start()
+    try:
+        deadline = time.monotonic() + timeout
+        while not done():
+            assert time.monotonic() < deadline, "pipeline did not finish in time"
+            await asyncio.sleep(0.005)
+    finally:
+        pipeline._task.cancel()
+
+
+def test_notifications_for_one_user_are_merged_into_one_dm(endpoint):
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=0.1, max_pending=100)
+
+    async def scenario():
+        pipeline.start()
+        pipeline.enqueue(1, 42, "🎁 You received **Tier List**!")
+        pipeline.enqueue(1, 42, "🎁 You received **Watch Video**!")
+        pipeline.enqueue(1, 7, "🎁 You received **DJ**!")
+        pipeline.enqueue(1, 42, "⌛ **Song Request** expired.")
+        await run_until(pipeline, lambda: pipeline.sent == 2)
+
+    asyncio.run(scenario())
+
+    by_user = {discord_id: content for _, discord_id, content in endpoint.sent}
+    assert set(by_user) == {42, 7}
+    assert by_user[42].splitlines() == [
+        "🎁 You received **Tier List**!",
+        "🎁 You received **Watch Video**!",
+        "⌛ **Song Request** expired.",
+    ]
+    assert endpoint.attempts == {42: 1, 7: 1}
+
+
+def test_burst_of_sends_is_paced_by_the_token_bucket(endpoint):
+    rate, burst, users = 200, 5, 300
+    pipeline = main.NotificationPipeline(rate=rate, burst=burst, coalesce_seconds=0, max_pending=1000)
+
+    async def scenario():
+        pipeline.start()
+        for discord_id in range(users):
+            pipeline.enqueue(1, discord_id, "🎁 You received **Tier List**!")
+        started = time.monotonic()
+        await run_until(pipeline, lambda: pipeline.sent == users)
+        return started
+
+    started = asyncio.run(scenario())
+
+    times = [sent_at for sent_at, _, _ in endpoint.sent]
+    # Only the burst goes out immediately; the rest trickle out at `rate` per second
+    assert times[-1] - started >= (users - burst) / rate * 0.95
+    for i, window_start in enumerate(times):
+        in_window = sum(1 for t in times[i:] if t - window_start <= 0.25)
+        assert in_window <= burst + rate * 0.25 + 1
+
+
+@pytest.mark.parametrize("statuses", [[429], [500, 503], [429, 502]])
+def test_rate_limits_and_server_errors_are_retried_with_backoff(endpoint, statuses):
+    endpoint.failures[42] = list(statuses)
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=0, max_pending=100)
+
+    async def scenario():
+        pipeline.start()
+        pipeline.enqueue(1, 42, "🎁 You received **Tier List**!")
+        await run_until(pipeline, lambda: pipeline.sent == 1)
+
+    asyncio.run(scenario())
+
+    assert endpoint.attempts[42] == len(statuses) + 1
+    assert pipeline.retried == len(statuses)
+    assert pipeline.dropped == 0
+    assert [content for _, _, content in endpoint.sent] == ["🎁 You received **Tier List**!"]
+
+
+def test_retry_backoff_grows_and_merges_newer_lines(endpoint, monkeypatch):
+    endpoint.failures[42] = [503, 503]
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=0, max_pending=100)
+    attempt_times = []
+    send = FakeChannel.send
+
+    async def timed_send(channel, content):
+        attempt_times.append(time.monotonic())
+        if len(attempt_times) == 1:
+            # Arrives while the first attempt is in flight, so it should ride along with the retry
+            pipeline.enqueue(1, 42, "second")
+        await send(channel, content)
+
+    monkeypatch.setattr(FakeChannel, "send", timed_send)
+
+    async def scenario():
+        pipeline.start()
+        pipeline.enqueue(1, 42, "first")
+        await run_until(pipeline, lambda: pipeline.sent == 1)
+
+    asyncio.run(scenario())
+
+    first_wait = attempt_times[1] - attempt_times[0]
+    second_wait = attempt_times[2] - attempt_times[1]
+    assert first_wait >= 0.01 and second_wait >= 0.02
+    assert [content.splitlines() for _, _, content in endpoint.sent] == [["first", "second"]]
+
+
+def test_persistent_server_errors_give_up_after_max_attempts(endpoint):
+    endpoint.failures[42] = [500] * 10
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=0, max_pending=100)
+
+    async def scenario():
+        pipeline.start()
+        pipeline.enqueue(1, 42, "🎁 You received **Tier List**!")
+        await run_until(pipeline, lambda: pipeline.dropped == 1)
+
+    asyncio.run(scenario())
+
+    assert endpoint.attempts[42] == main.NOTIFY_MAX_ATTEMPTS
+    assert endpoint.sent == []
+
+
+@pytest.mark.parametrize("status", [403, 400])
+def test_undeliverable_dms_are_dropped_without_retrying(endpoint, status):
+    endpoint.failures[42] = [status]
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=0, max_pending=100)
+
+    async def scenario():
+        pipeline.start()
+        pipeline.enqueue(1, 42, "🎁 You received **Tier List**!")
+        pipeline.enqueue(1, 7, "🎁 You received **DJ**!")
+        await run_until(pipeline, lambda: pipeline.sent == 1 and endpoint.attempts.get(42))
+        # Give a (wrong) retry the chance to happen
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert endpoint.attempts[42] == 1
+    assert pipeline.retried == 0
+    assert (pipeline.undeliverable, pipeline.dropped) == ((1, 0) if status == 403 else (0, 1))
+    assert [discord_id for _, discord_id, _ in endpoint.sent] == [7]
+
+
+def test_new_users_past_max_pending_are_dropped(endpoint):
+    pipeline = main.NotificationPipeline(rate=100, burst=10, coalesce_seconds=10, max_pending=2)
+
+    async def scenario():
+        pipeline.start()
+        for discord_id in (1, 2, 3):
+            pipeline.enqueue(1, discord_id, "hello")
+        pipeline.enqueue(1, 1, "merged into an existing DM, so still accepted")
+        pipeline._task.cancel()
+
+    asyncio.run(scenario())
+
+    assert set(pipeline.pending) == {1, 2}
+    assert len(pipeline.pending[1]["lines"]) == 2
+    assert pipeline.dropped == 1
@@ -0,0 +1,219 @@
+"""Fault-injection tests for the durable mutation outbox, against an in-memory stand-in DB."""
+import asyncio
+import threading
+import time
+
+import psycopg2
+import pytest
+
+import main
+
+GUILD = 1
+VIEWER = 42
+TWITCH = "viewer"
+REWARD = main.RewardItem("tier_list_count", "Tier List", None, 0, True)
+
+# Registry statement name by the SQL it EXECUTEs, so the fake can answer main's own queries
+EXECUTE_NAMES = {execute_sql: name for name, (_, execute_sql) in main.STATEMENTS.items()}
+
+
+class FakeDatabase:
+    """Just enough of Postgres for the reward mutations: counts, applied_mutations and transactions."""
+
+    def __init__(self):
+        self.counts = {}
+        self.applied_mutations = set()
+        self.applied_order = []   # (op, mutation_id) per committed mutation
+        self.down = False         # connections can't be opened
+        self.drop_queries = False # open connections fail mid-query
+        self.query_delay = 0.0
+        self.lock = threading.Lock()
+
+    def connect(self, role="primary"):
+        return None if self.down else FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.prepared = set()
+        self.closed = False
+        self.pending_ids = set()
+        self.pending_counts = {}
+        self.pending_ops = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        with self.db.lock:
+            self.db.applied_mutations |= self.pending_ids
+            self.db.counts.update(self.pending_counts)
+            self.db.applied_order.extend(self.pending_ops)
+        self.rollback()
+
+    def rollback(self):
+        self.pending_ids, self.pending_counts, self.pending_ops = set(), {}, []
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, sql, params=()):
+        db = self.connection.db
+        if db.drop_queries:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if db.query_delay:
+            time.sleep(db.query_delay)
+        if sql.startswith("PREPARE"):
+            return
+
+        if "applied_mutations" in sql:
+            mutation_id = params[0]
+            claimed = mutation_id in db.applied_mutations or mutation_id in self.connection.pending_ids
+            self.rowcount = 0 if claimed else 1
+            self.connection.pending_ids.add(mutation_id)
+            self.connection.current_id = mutation_id
+            return
+
+        name = EXECUTE_NAMES[sql]
+        key = (params[0], VIEWER, REWARD.key)
+        count = self.connection.pending_counts.get(key, db.counts.get(key, 0))
+        if name == "discord_id_by_twitch":
+            self._row = (VIEWER,) if params[1] == TWITCH else None
+        elif name == "lookup_reward":
+            self._row = (VIEWER, count) if params[1] == TWITCH else None
+        elif name in ("increment_reward", "decrement_reward"):
+            count += 1 if name == "increment_reward" else -1
+            self.connection.pending_counts[key] = count
+            self.connection.pending_ops.append((name.split("_")[0], getattr(self.connection, "current_id", None)))
+            self._row = (count,)
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    fake = FakeDatabase()
+    monkeypatch.setattr(main, "get_db_connection", fake.connect)
+    monkeypatch.setattr(main, "release_db_connection", lambda conn: None)
+    monkeypatch.setattr(main, "find_catalog_reward", lambda guild_id, key, include_inactive=False: REWARD)
+    # Side effects that aren't under test
+    for name in ("log_reward_activity", "publish_change", "refresh_inventory_row"):
+        monkeypatch.setattr(main, name, lambda *args: None)
+    monkeypatch.setattr(main, "OUTBOX_PATH", str(tmp_path / "outbox.jsonl"))
+    monkeypatch.setattr(main, "OUTBOX_TIMEOUT", 2.0)
+    monkeypatch.setattr(main, "_outbox_pending", 0)
+    return fake
+
+
+def count(db):
+    return db.counts.get((GUILD, VIEWER, REWARD.key), 0)
+
+
+def mutate(op):
+    return asyncio.run(main.run_reward_mutation(op, GUILD, TWITCH, REWARD.key))
+
+
+@pytest.mark.parametrize("fault", ["down", "drop_queries"])
+def test_outage_journals_the_mutation(db, fault):
+    setattr(db, fault, True)
+
+    success, message, queued = mutate("increment")
+
+    assert (success, queued) == (True, True)
+    assert message == main.OUTBOX_QUEUED_MESSAGE
+    journal = main.read_outbox()
+    assert [(m["op"], m["twitch_username"], m["reward_key"]) for m in journal] == [("increment", TWITCH, REWARD.key)]
+    assert count(db) == 0
+
+
+def test_replay_applies_queued_changes_in_order(db):
+    db.down = True
+    mutate("increment")
+    mutate("decrement")
+
+    # Back up, but older changes are still waiting: new ones must queue behind them
+    db.down = False
+    _, _, queued = mutate("increment")
+    assert queued
+
+    assert main.replay_outbox() == 3
+    # Out of order, the decrement would have hit a zero count and been dropped
+    assert [op for op, _ in db.applied_order] == ["increment", "decrement", "increment"]
+    assert count(db) == 1
+    assert main.read_outbox() == []
+    assert not main.outbox_has_pending()
+
+    # With the journal drained, changes go straight to the DB again
+    assert mutate("increment")[2] is False
+    assert count(db) == 2
+
+
+def test_replay_stops_while_db_is_still_down(db):
+    db.down = True
+    mutate("increment")
+
+    assert main.replay_outbox() == 0
+    assert len(main.read_outbox()) == 1
+
+    db.down = False
+    assert main.replay_outbox() == 1
+    assert count(db) == 1
+
+
+def test_second_replay_of_the_same_mutations_is_skipped(db):
+    db.down = True
+    mutate("increment")
+    mutate("increment")
+    journal = main.read_outbox()
+
+    db.down = False
+    assert main.replay_outbox() == 2
+    assert count(db) == 2
+
+    # e.g. a crash after applying the batch but before the journal was compacted
+    main.rewrite_outbox(journal)
+    assert main.replay_outbox() == 2
+    assert count(db) == 2
+    assert len(db.applied_order) == 2
+    assert db.applied_mutations == {m["id"] for m in journal}
+
+
+def test_slow_attempt_that_commits_after_being_queued_is_not_applied_twice(db, monkeypatch):
+    monkeypatch.setattr(main, "OUTBOX_TIMEOUT", 0.05)
+    db.query_delay = 0.2
+
+    async def scenario():
+        result = await main.run_reward_mutation("increment", GUILD, TWITCH, REWARD.key)
+        # Let the original attempt finish committing in its worker thread
+        await asyncio.sleep(1)
+        return result
+
+    _, _, queued = asyncio.run(scenario())
+    assert queued
+    assert count(db) == 1
+
+    db.query_delay = 0.0
+    assert main.replay_outbox() == 1
+    assert count(db) == 1
+
+
+def test_torn_journal_line_is_skipped(db):
+    db.down = True
+    mutate("increment")
+    with open(main.OUTBOX_PATH, "a", encoding="utf-8") as journal:
+        journal.write('{"id": "torn", "op": "incr')
+    mutate("increment")
+
+    assert len(main.read_outbox()) == 2
+    db.down = False
+    assert main.replay_outbox() == 2
+    assert count(db) == 2
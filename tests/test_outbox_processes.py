@@ -0,0 +1,94 @@
+"""Two-process tests for the outbox journal: the layout of `gunicorn main:app` with several workers."""
+import asyncio
+import multiprocessing
+
+import pytest
+
+import main
+
+# Workers are forked, as gunicorn does, so they inherit the patched OUTBOX_PATH
+fork = multiprocessing.get_context("fork")
+
+
+@pytest.fixture
+def journal(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "OUTBOX_PATH", str(tmp_path / "outbox.jsonl"))
+    applied = []
+
+    def apply_mutation(mutation):
+        applied.append(mutation["id"])
+        return True, "Applied."
+
+    monkeypatch.setattr(main, "apply_mutation", apply_mutation)
+    return applied
+
+
+def mutation(mutation_id):
+    return {"id": mutation_id, "op": "increment", "guild_id": 1, "twitch_username": "viewer", "reward_key": "tier_list_count"}
+
+
+def append_many(worker, count):
+    for i in range(count):
+        main.append_to_outbox(mutation(f"{worker}-{i}"))
+
+
+def test_appends_from_another_process_survive_compaction(journal):
+    workers, per_worker = 2, 300
+    children = [fork.Process(target=append_many, args=(worker, per_worker)) for worker in range(workers)]
+    for child in children:
+        child.start()
+
+    # Replay and compact over and over while the other processes keep appending
+    while any(child.is_alive() for child in children):
+        main.replay_outbox(batch_size=7)
+    for child in children:
+        child.join()
+        assert child.exitcode == 0
+    while main.outbox_has_pending():
+        main.replay_outbox()
+
+    expected = {f"{worker}-{i}" for worker in range(workers) for i in range(per_worker)}
+    assert len(journal) == len(expected)
+    assert set(journal) == expected
+    # Each process's changes were applied in the order it queued them
+    for worker in range(workers):
+        mine = [int(mutation_id.split("-")[1]) for mutation_id in journal if mutation_id.startswith(f"{worker}-")]
+        assert mine == sorted(mine)
+
+
+def hold_replay_lock(holding, release):
+    with main.outbox_file_lock(".replay.lock", blocking=False) as acquired:
+        assert acquired
+        holding.set()
+        release.wait(10)
+
+
+def test_only_one_process_replays_at_a_time(journal):
+    main.append_to_outbox(mutation("queued"))
+    holding, release = fork.Event(), fork.Event()
+    child = fork.Process(target=hold_replay_lock, args=(holding, release))
+    child.start()
+    try:
+        assert holding.wait(10)
+        assert main.replay_outbox() == 0
+        assert journal == []
+    finally:
+        release.set()
+        child.join()
+
+    assert main.replay_outbox() == 1
+    assert journal == ["queued"]
+
+
+def test_new_changes_queue_behind_another_process_s_journal(journal):
+    child = fork.Process(target=append_many, args=("other", 1))
+    child.start()
+    child.join()
+
+    # The DB is up, but an older change from the other process is still waiting
+    success, message, queued = asyncio.run(main.run_reward_mutation("increment", 1, "viewer", "tier_list_count"))
+    assert (success, queued) == (True, True)
+    assert journal == []
+
+    assert main.replay_outbox() == 2
+    assert journal[0] == "other-0"